@@ -1,20 +1,27 @@
 import logging
 import os
 import platform
+import signal
 import tkinter as tk
 from tkinter.ttk import *
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import json
 import subprocess
-import psutil
 from datetime import datetime
-from threading import Thread
-import time
+import queue
+from threading import Event, Lock, Thread
 import win32com.client
+from backupConfig import validate_config, write_config
+from backupControl import PID_FILE, lock_is_held, read_pid, send_command
+from backupLogStore import LOG_STORE_FILE, PAGE_SIZE, LogStore
+from backupLogTail import LogTailer
 
 CONFIG_FILE = 'backup_config.json'
 SCRIPT_FILE = 'backupFoldersFiles_exceptionHandling.py'
 AUTO_REFRESH_INTERVAL = 5  # seconds
+LOG_VIEW_MAX_LINES = 2000  # lines kept in a log view; older ones are dropped
+LOG_VIEW_UPDATE_MS = 200  # how often the Tk thread applies lines read in the background
+PROGRESS_POLL_MS = 1000  # how often the Home tab asks the daemon for progress
 
 def load_config():
     try:
@@ -27,12 +34,14 @@ def load_config():
 
 def save_config(data):
     try:
-        with open(CONFIG_FILE, 'w') as file:
-            json.dump(data, file, indent=4)
+        # Validate first, then replace the file atomically so the daemon never reads a partial write
+        write_config(validate_config(data), CONFIG_FILE)
         update_timestamp()
+        return True
     except Exception as e:
         logging.error(f"Failed to save config: {e}")
         messagebox.showerror("Error", f"Failed to save configuration: {e}")
+        return False
 
 def get_last_modified_time():
     try:
@@ -64,15 +73,22 @@ def toggle_service(enable):
         logging.error(f"Failed to toggle service: {e}")
         messagebox.showerror("Error", f"Failed to toggle service: {e}")
 
-def is_script_running(script_name):
+def is_script_running():
+    """Return the daemon's status, or None when it is not running.
+
+    Asks the daemon over its control channel; if it does not answer, the PID
+    lock file still tells whether a daemon process is alive.
+    """
     try:
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            if proc.info['cmdline'] and script_name in proc.info['cmdline']:
-                return True
-        return False
+        status = send_command('status')
+        if status is not None:
+            return status
+        if lock_is_held(PID_FILE):
+            return {'pid': read_pid(PID_FILE)}
+        return None
     except Exception as e:
         logging.error(f"Failed to check if script is running: {e}")
-        return False
+        return None
 
 def update_home_status():
     try:
@@ -82,17 +98,19 @@ def update_home_status():
         else:
             service_status_label.config(text="Service Disabled", bg="red")
 
-        script_running = is_script_running(SCRIPT_FILE)
-        if script_running:
-            script_status_label.config(text="Script Running", bg="green")
-        else:
-            script_status_label.config(text="Script Not Running", bg="red")
+        run_in_background(is_script_running, show_script_status)
     except Exception as e:
         logging.error(f"Failed to update home status: {e}")
 
+def show_script_status(status):
+    if status:
+        script_status_label.config(text=f"Script Running (PID {status.get('pid')})", bg="green")
+    else:
+        script_status_label.config(text="Script Not Running", bg="red")
+
 def start_script():
     try:
-        if not is_script_running(SCRIPT_FILE):
+        if not is_script_running():
             subprocess.Popen(["python", SCRIPT_FILE])
             messagebox.showinfo("Script Started", "The backup script has started running.")
         update_home_status()
@@ -102,18 +120,63 @@ def start_script():
 
 def stop_script():
     try:
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            if proc.info['cmdline'] and SCRIPT_FILE in proc.info['cmdline']:
-                proc.terminate()
-                messagebox.showinfo("Script Stopped", "The backup script has been stopped.")
+        if send_command('stop') is not None:
+            messagebox.showinfo("Script Stopped", "The backup script will stop after the current backup.")
+        elif lock_is_held(PID_FILE):
+            os.kill(read_pid(PID_FILE), signal.SIGTERM)
+            messagebox.showinfo("Script Stopped", "The backup script has been stopped.")
         update_home_status()
     except Exception as e:
         logging.error(f"Failed to stop script: {e}")
         messagebox.showerror("Error", f"Failed to stop script: {e}")
 
+def trigger_backup():
+    try:
+        if send_command('trigger') is None:
+            messagebox.showerror("Error", "The backup script is not running.")
+    except Exception as e:
+        logging.error(f"Failed to trigger backup: {e}")
+        messagebox.showerror("Error", f"Failed to trigger backup: {e}")
+
+def fetch_progress():
+    try:
+        return send_command('progress', timeout=1)
+    except Exception as e:
+        logging.error(f"Failed to read backup progress: {e}")
+        return None
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+def poll_progress():
+    """Refresh the progress bar from the daemon's live metrics, then poll again."""
+    run_in_background(fetch_progress, show_progress)
+
+def show_progress(progress):
+    if not progress:
+        progress_bar.config(value=0)
+        progress_label.config(text="No backup running" if progress is not None else "Backup script not reachable")
+    else:
+        scanned = sum(run.get('files_scanned', 0) for run in progress.values())
+        expected = sum(run['files_expected'] for run in progress.values())
+        etas = [run['eta'] for run in progress.values() if run['eta'] is not None]
+        copied = sum(run.get('bytes_copied', 0) for run in progress.values())
+        elapsed = max(run['elapsed'] for run in progress.values())
+        rate = copied / elapsed / (1024 * 1024) if elapsed else 0
+        text = f"{len(progress)} pair(s) | {scanned} of {expected or '?'} files | {rate:.1f} MB/s"
+        known = expected and all(run['fraction'] is not None for run in progress.values())
+        progress_bar.config(value=100 * scanned / expected if known else 0)
+        if etas:
+            text += f" | ETA {format_duration(max(etas))}"
+        progress_label.config(text=text)
+    root.after(PROGRESS_POLL_MS, poll_progress)
+
 def update_config():
     try:
-        config = {
+        config = load_config()  # keep keys this form does not edit (e.g. manifest_dir)
+        config.update({
             "run_enabled": run_enabled_var.get(),
             "source_dirs": src_dirs_entry.get().split(';'),
             "dest_dirs": dest_dirs_entry.get().split(';'),
@@ -122,8 +185,9 @@ def update_config():
             "error_log_file": error_log_entry.get(),
             "sleep_time": int(sleep_time_entry.get()),
             "run_at_startup": run_at_startup_var.get()
-        }
-        save_config(config)
+        })
+        if not save_config(config):
+            return
         set_run_at_startup(config['run_at_startup'])
         messagebox.showinfo("Success", "Configuration saved successfully!")
     except Exception as e:
@@ -144,29 +208,161 @@ def select_directory(entry_field):
         logging.error(f"Failed to select directory: {e}")
         messagebox.showerror("Error", f"Failed to select directory: {e}")
 
+class LogView:
+    """Tail-follows a log file into a text widget, newest lines first.
+
+    A background thread polls the file with a LogTailer, so file I/O never runs
+    on the Tk thread; the lines it reads are queued and applied by
+    root.after callbacks. The widget is capped at LOG_VIEW_MAX_LINES lines.
+    """
+
+    def __init__(self, log_text_widget):
+        self.widget = log_text_widget
+        self.tailer = None
+        self._lock = Lock()
+        self._updates = queue.SimpleQueue()
+        self._wake = Event()
+        Thread(target=self._poll_loop, daemon=True).start()
+        self._apply_updates()
+
+    def follow(self, log_file):
+        """Show log_file from its tail; also used to force a reload."""
+        with self._lock:
+            self.tailer = LogTailer(log_file)
+        self._wake.set()
+
+    def _poll_loop(self):
+        while True:
+            with self._lock:
+                tailer = self.tailer
+            if tailer is not None:
+                try:
+                    self._updates.put((tailer, tailer.read_new()))
+                except Exception as e:
+                    logging.error(f"Failed to read log {tailer.log_file}: {e}")
+                    self._updates.put((tailer, False))
+            self._wake.wait(AUTO_REFRESH_INTERVAL)
+            self._wake.clear()
+
+    def _apply_updates(self):
+        try:
+            while True:
+                tailer, result = self._updates.get_nowait()
+                if tailer is not self.tailer:
+                    continue  # a reload replaced this tailer
+                if result is None or result is False:
+                    self.widget.delete(1.0, tk.END)
+                    self.widget.insert(tk.END, "Log file not found." if result is None else "Failed to view log.")
+                    tailer.reset()
+                    continue
+                restarted, lines = result
+                if restarted or self.widget.get(1.0, '1.end') in ("Log file not found.", "Failed to view log."):
+                    self.widget.delete(1.0, tk.END)
+                if lines:
+                    lines.reverse()  # newest first
+                    self.widget.insert(1.0, '\n'.join(lines[:LOG_VIEW_MAX_LINES]) + '\n')
+                    self.widget.delete(f"{LOG_VIEW_MAX_LINES + 1}.0", tk.END)
+        except queue.Empty:
+            pass
+        root.after(LOG_VIEW_UPDATE_MS, self._apply_updates)
+
+log_views = {}
+
 def view_log(log_file, log_text_widget):
+    """Start (or restart from the tail) following log_file in log_text_widget."""
     try:
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as file:
-                lines = file.readlines()
-                lines.reverse()  # Reverse the log order to display newest first
-                log_text_widget.delete(1.0, tk.END)
-                log_text_widget.insert(tk.END, ''.join(lines))
-        else:
-            log_text_widget.delete(1.0, tk.END)
-            log_text_widget.insert(tk.END, "Log file not found.")
+        if log_text_widget not in log_views:
+            log_views[log_text_widget] = LogView(log_text_widget)
+        log_views[log_text_widget].follow(log_file)
     except Exception as e:
         logging.error(f"Failed to view log: {e}")
         log_text_widget.delete(1.0, tk.END)
         log_text_widget.insert(tk.END, "Failed to view log.")
 
-def auto_refresh_logs(log_file, log_text_widget):
-    while True:
+ui_queue = queue.SimpleQueue()
+log_store = None
+
+def run_in_background(work, done):
+    """Run work() on a thread and hand its result to done(result) on the Tk thread."""
+    def runner():
         try:
-            view_log(log_file, log_text_widget)
-            time.sleep(AUTO_REFRESH_INTERVAL)
+            ui_queue.put((done, work(), None))
         except Exception as e:
-            logging.error(f"Failed to auto-refresh logs: {e}")
+            ui_queue.put((done, None, e))
+    Thread(target=runner, daemon=True).start()
+
+def process_ui_queue():
+    try:
+        while True:
+            done, result, error = ui_queue.get_nowait()
+            if error is not None:
+                logging.error(f"Background task failed: {error}")
+                messagebox.showerror("Error", f"Background task failed: {error}")
+            else:
+                done(result)
+    except queue.Empty:
+        pass
+    root.after(LOG_VIEW_UPDATE_MS, process_ui_queue)
+
+def get_log_store():
+    global log_store
+    db_path = config.get('log_store_file', LOG_STORE_FILE)
+    if log_store is None or log_store.db_path != db_path:
+        log_store = LogStore(db_path)
+    return log_store
+
+def parse_day(text, end_of_day=False):
+    """'YYYY-MM-DD' to epoch seconds (the end of that day when end_of_day); None when empty."""
+    text = text.strip()
+    if not text:
+        return None
+    return datetime.strptime(text, '%Y-%m-%d').timestamp() + (86400 if end_of_day else 0)
+
+search_cursors = [None]  # cursor of each page shown so far; the last one is the current page
+
+def search_logs(direction=0):
+    """Query the log store with the search panel filters; direction -1/+1 pages newer/older."""
+    try:
+        filters = {
+            'text': search_text_entry.get().strip() or None,
+            'path': search_path_entry.get().strip() or None,
+            'level': search_level_var.get() or None,
+            'pair': search_pair_var.get() or None,
+            'since': parse_day(search_since_entry.get()),
+            'until': parse_day(search_until_entry.get(), end_of_day=True),
+        }
+    except ValueError as e:
+        messagebox.showerror("Error", f"Dates must be YYYY-MM-DD: {e}")
+        return
+    if direction == 0:
+        del search_cursors[1:]
+        search_cursors[0] = None
+    elif direction < 0:
+        if len(search_cursors) == 1:
+            return
+        search_cursors.pop()
+    else:
+        rows = search_results.get_children()
+        if len(rows) < PAGE_SIZE:
+            return
+        last = search_results.item(rows[-1], 'values')
+        search_cursors.append((float(last[0]), int(search_results.item(rows[-1], 'text'))))
+    before = search_cursors[-1]
+
+    def work():
+        store = get_log_store()
+        return store.query(before=before, **filters), store.pairs()
+
+    run_in_background(work, show_search_results)
+
+def show_search_results(result):
+    rows, pairs = result
+    search_pair_combo['values'] = [''] + pairs
+    search_results.delete(*search_results.get_children())
+    for record_id, ts, level, pair, path, message in rows:
+        shown_time = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+        search_results.insert('', tk.END, text=str(record_id), values=(ts, shown_time, level, pair or '', path or '', message))
+    search_page_label.config(text=f"Page {len(search_cursors)} | {len(rows)} records")
 
 def set_run_at_startup(enable):
     system_platform = platform.system()
@@ -235,11 +431,20 @@ script_status_label = tk.Label(script_frame, text="Script Not Running", bg="red"
 script_status_label.pack(padx=10, pady=10)
 Button(script_frame, text="Start Script", command=start_script, width=20).pack(padx=10, pady=5)
 Button(script_frame, text="Stop Script", command=stop_script, width=20).pack(padx=10, pady=5)
+Button(script_frame, text="Run Backup Now", command=trigger_backup, width=20).pack(padx=10, pady=5)
+
+# Backup Progress Section
+progress_frame = tk.LabelFrame(home_tab, text="Backup Progress", padx=10, pady=10)
+progress_frame.grid(row=1, column=0, columnspan=3, padx=10, pady=5, sticky="nsew")
+progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=700, mode="determinate", maximum=100)
+progress_bar.pack(padx=10, pady=5)
+progress_label = tk.Label(progress_frame, text="")
+progress_label.pack(padx=10, pady=5)
 
 # Log Viewing Section
 log_frame = tk.LabelFrame(home_tab, text="Logs", padx=10, pady=10)
-log_frame.grid(row=1, column=0, columnspan=3, padx=10, pady=10, sticky="nsew")
-log_text = scrolledtext.ScrolledText(log_frame, width=90, height=15)
+log_frame.grid(row=2, column=0, columnspan=3, padx=10, pady=10, sticky="nsew")
+log_text = scrolledtext.ScrolledText(log_frame, width=90, height=11)
 log_text.pack(padx=10, pady=10)
 Button(log_frame, text="View/Reload Logs", command=lambda: view_log(config['log_file'], log_text)).pack(padx=10, pady=5)
 
@@ -308,21 +513,67 @@ timestamp_label.grid(row=9, column=1, padx=10, pady=10, sticky="w")
 # Error Tab
 error_log_frame = tk.LabelFrame(error_tab, text="Error Logs", padx=10, pady=10)
 error_log_frame.pack(fill="both", expand=True, padx=10, pady=10)
-error_log_text = scrolledtext.ScrolledText(error_log_frame, width=90, height=25)
+error_log_text = scrolledtext.ScrolledText(error_log_frame, width=90, height=8)
 error_log_text.pack(padx=10, pady=10)
 Button(error_log_frame, text="View/Reload Error Logs", command=lambda: view_log(config['error_log_file'], error_log_text)).pack(padx=10, pady=5)
 
+# Log Search Section
+search_frame = tk.LabelFrame(error_tab, text="Search Logs", padx=10, pady=10)
+search_frame.pack(fill="both", expand=True, padx=10, pady=10)
+search_filters = tk.Frame(search_frame)
+search_filters.pack(fill="x")
+tk.Label(search_filters, text="Text").grid(row=0, column=0, sticky="w")
+search_text_entry = Entry(search_filters, width=30)
+search_text_entry.grid(row=0, column=1, padx=5, pady=2)
+tk.Label(search_filters, text="Path starts with").grid(row=0, column=2, sticky="w")
+search_path_entry = Entry(search_filters, width=30)
+search_path_entry.grid(row=0, column=3, padx=5, pady=2)
+tk.Label(search_filters, text="Level").grid(row=1, column=0, sticky="w")
+search_level_var = tk.StringVar(value='ERROR')
+ttk.Combobox(search_filters, textvariable=search_level_var, values=['', 'ERROR', 'WARNING', 'INFO'],
+             width=27, state='readonly').grid(row=1, column=1, padx=5, pady=2)
+tk.Label(search_filters, text="Pair").grid(row=1, column=2, sticky="w")
+search_pair_var = tk.StringVar(value='')
+search_pair_combo = ttk.Combobox(search_filters, textvariable=search_pair_var, values=[''], width=27, state='readonly')
+search_pair_combo.grid(row=1, column=3, padx=5, pady=2)
+tk.Label(search_filters, text="From (YYYY-MM-DD)").grid(row=2, column=0, sticky="w")
+search_since_entry = Entry(search_filters, width=30)
+search_since_entry.grid(row=2, column=1, padx=5, pady=2)
+tk.Label(search_filters, text="To (YYYY-MM-DD)").grid(row=2, column=2, sticky="w")
+search_until_entry = Entry(search_filters, width=30)
+search_until_entry.grid(row=2, column=3, padx=5, pady=2)
+search_buttons = tk.Frame(search_frame)
+search_buttons.pack(fill="x", pady=5)
+Button(search_buttons, text="Search", command=search_logs).pack(side="left", padx=5)
+Button(search_buttons, text="< Newer", command=lambda: search_logs(-1)).pack(side="left", padx=5)
+Button(search_buttons, text="Older >", command=lambda: search_logs(1)).pack(side="left", padx=5)
+search_page_label = tk.Label(search_buttons, text="")
+search_page_label.pack(side="left", padx=10)
+search_results = ttk.Treeview(search_frame, columns=('ts', 'time', 'level', 'pair', 'path', 'message'),
+                              displaycolumns=('time', 'level', 'pair', 'path', 'message'), height=10)
+search_results.column('#0', width=0, stretch=False)
+for column, heading, width in (('time', 'Time', 130), ('level', 'Level', 60), ('pair', 'Pair', 150),
+                               ('path', 'Path', 200), ('message', 'Message', 400)):
+    search_results.heading(column, text=heading)
+    search_results.column(column, width=width)
+search_results.pack(fill="both", expand=True)
+
 # Initialize the timestamp label with the current timestamp
 update_timestamp()
 
 # Initialize the home status
 update_home_status()
 
+# Apply results of background tasks (e.g. log searches) on the Tk thread
+process_ui_queue()
+
+# Live progress from the daemon's metrics
+poll_progress()
+
+# Follow both logs; the views refresh themselves every AUTO_REFRESH_INTERVAL seconds
+view_log(config['log_file'], log_text)
+view_log(config['error_log_file'], error_log_text)
+
 # Run the GUI loop
 root.mainloop()
 
-
-## Threads =================================================
-# Start auto-refresh thread
-log_auto_refresh_thread = Thread(target=auto_refresh_logs, args=(config['log_file'], log_text), daemon=True)
-log_auto_refresh_thread.start()
\ No newline at end of file
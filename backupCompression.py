@@ -0,0 +1,161 @@
+import bz2
+import gzip
+import hashlib
+import lzma
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backupManifest import is_unchanged
+from backupResume import temp_path_for
+
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'bz2': '.bz2', 'lzma': '.xz'}
+COMPRESSION_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'lzma': lzma.open}
+DEFAULT_LEVELS = {'gzip': 6, 'bz2': 9, 'lzma': 6}
+COMPRESSION_BLOCK_SIZE = 8 * 1024 * 1024  # each block is an independent stream
+
+_pools = {}  # processes -> long-lived ProcessPoolExecutor shared by every cycle
+_pools_lock = threading.Lock()
+
+def compress_block(method, level, data):
+    """Compress one block as a complete gzip/bz2/xz stream (top level so it pickles)."""
+    if method == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if method == 'bz2':
+        return bz2.compress(data, compresslevel=level)
+    return lzma.compress(data, preset=level)
+
+def compression_pool(processes):
+    """Return the daemon's long-lived pool of processes compression workers.
+
+    Workers are started from a forkserver (spawn where that is unavailable)
+    rather than forked from the daemon, whose watcher, scheduler and log writer
+    threads may hold locks at the moment of a fork.
+    """
+    with _pools_lock:
+        executor = _pools.get(processes)
+        if executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            executor = _pools[processes] = ProcessPoolExecutor(max_workers=processes, mp_context=context)
+        return executor
+
+def _discard_pool(processes, executor):
+    """Forget a pool whose worker died so the next run starts a fresh one."""
+    with _pools_lock:
+        if _pools.get(processes) is executor:
+            del _pools[processes]
+
+def shutdown_compression_pools():
+    with _pools_lock:
+        executors = list(_pools.values())
+        _pools.clear()
+    for executor in executors:
+        executor.shutdown()
+
+def decompress_file(compressed_file, out_file):
+    """Restore a file written by CompressedStore; all three formats accept concatenated streams."""
+    for method, suffix in COMPRESSION_SUFFIXES.items():
+        if compressed_file.endswith(suffix):
+            with COMPRESSION_OPENERS[method](compressed_file, 'rb') as f_in, open(out_file, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out, COMPRESSION_BLOCK_SIZE)
+            shutil.copystat(compressed_file, out_file)
+            return out_file
+    raise ValueError(f"Unknown compression suffix: {compressed_file}")
+
+class CompressedStore:
+    """Mirror destination where every file is stored compressed (name + .gz/.bz2/.xz).
+
+    Files larger than one block are split into independently compressed blocks
+    that the daemon's long-lived process pool compresses in parallel; the blocks
+    are written back in order as concatenated streams, which gzip, bzip2 and xz
+    all read as one file.
+    Change detection compares the manifest against the stat of the compressed
+    file, so the store is never decompressed to decide what to copy.
+    """
+
+    def __init__(self, dest_dir, method='gzip', level=None, processes=None, block_size=COMPRESSION_BLOCK_SIZE):
+        if method not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unsupported compression method: {method}")
+        self.dest_root = dest_dir
+        self.method = method
+        self.level = DEFAULT_LEVELS[method] if level is None else level
+        self.suffix = COMPRESSION_SUFFIXES[method]
+        self.block_size = block_size
+        self.processes = processes or os.cpu_count() or 1
+        self._executor = None
+
+    def __enter__(self):
+        if self.processes > 1:
+            self._executor = compression_pool(self.processes)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._executor = None  # the pool outlives the store; shutdown_compression_pools() ends it
+
+    def _read_blocks(self, f_in, md5):
+        while True:
+            block = f_in.read(self.block_size)
+            if not block:
+                return
+            md5.update(block)
+            yield block
+
+    def _compress_stream(self, src_file, f_out):
+        """Compress src_file into f_out; return (checksum, compressed bytes written)."""
+        md5 = hashlib.md5()
+        written = 0
+        with open(src_file, 'rb') as f_in:
+            blocks = self._read_blocks(f_in, md5)
+            if self._executor is None or os.fstat(f_in.fileno()).st_size <= self.block_size:
+                compressed = (compress_block(self.method, self.level, block) for block in blocks)
+                for data in compressed:
+                    f_out.write(data)
+                    written += len(data)
+                return md5.hexdigest(), written
+
+            # Keep at most two blocks per process in flight to bound memory
+            in_flight = []
+            window = self.processes * 2
+            try:
+                for block in blocks:
+                    in_flight.append(self._executor.submit(compress_block, self.method, self.level, block))
+                    if len(in_flight) >= window:
+                        data = in_flight.pop(0).result()
+                        f_out.write(data)
+                        written += len(data)
+                for future in in_flight:
+                    data = future.result()
+                    f_out.write(data)
+                    written += len(data)
+            except BrokenProcessPool:
+                _discard_pool(self.processes, self._executor)
+                raise
+        return md5.hexdigest(), written
+
+    def backup(self, src_file, dest_file, rel_file, src_stat, manifest, options):
+        """Write dest_file + suffix compressed; None when the stored copy is current."""
+        compressed_file = dest_file + self.suffix
+        entry = manifest.get(rel_file)
+        if entry is not None:
+            try:
+                if is_unchanged(entry, src_stat, os.stat(compressed_file)):
+                    return None
+            except FileNotFoundError:
+                pass
+
+        temp_file = temp_path_for(compressed_file)
+        try:
+            with open(temp_file, 'wb') as f_out:
+                checksum, written = self._compress_stream(src_file, f_out)
+            shutil.copystat(src_file, temp_file)
+            os.replace(temp_file, compressed_file)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        manifest.record(rel_file, src_stat, checksum, os.stat(compressed_file))
+        return checksum, self.method, written
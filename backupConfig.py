@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import tempfile
+
+CONFIG_FILE = 'backup_config.json'
+REQUIRED_KEYS = {
+    'run_enabled': str,
+    'source_dirs': list,
+    'dest_dirs': list,
+    'log_file': str,
+    'error_log_file': str,
+    'sleep_time': (int, float),
+}
+NON_NEGATIVE_KEYS = (
+    'workers', 'sleep_time', 'full_rescan_interval', 'delta_threshold', 'delta_block_size', 'snapshot_keep',
+    'pack_threshold', 'pack_segment_size', 'log_max_bytes', 'log_rotate_interval', 'log_retention_days',
+    'log_retention_bytes', 'rotation_check_interval', 'log_ship_interval', 'scrub_interval', 'scrub_sample',
+    'metrics_port', 'resume_threshold', 'resume_block_size', 'durability_batch_files', 'durability_batch_bytes',
+)
+
+class ConfigError(ValueError):
+    """The configuration file is readable but not a usable configuration."""
+
+def validate_config(config):
+    """Raise ConfigError if config cannot drive the daemon; return it otherwise."""
+    if not isinstance(config, dict):
+        raise ConfigError("configuration must be a JSON object")
+    for key, expected in REQUIRED_KEYS.items():
+        if key not in config:
+            raise ConfigError(f"missing key: {key}")
+        if not isinstance(config[key], expected) or isinstance(config[key], bool):
+            raise ConfigError(f"wrong type for {key}: {type(config[key]).__name__}")
+    if len(config['source_dirs']) != len(config['dest_dirs']):
+        raise ConfigError("source_dirs and dest_dirs must have the same length")
+    for directory in config['source_dirs'] + config['dest_dirs']:
+        if not isinstance(directory, str) or not directory:
+            raise ConfigError(f"invalid source or destination directory: {directory!r}")
+    for key in NON_NEGATIVE_KEYS:
+        value = config.get(key)
+        if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0):
+            raise ConfigError(f"{key} must be a non-negative number")
+    if not isinstance(config.get('pair_options', {}), dict):
+        raise ConfigError("pair_options must be an object keyed by source directory")
+    return config
+
+def read_config(path=CONFIG_FILE):
+    with open(path, 'r') as config_file:
+        return validate_config(json.load(config_file))
+
+def write_config(config, path=CONFIG_FILE):
+    """Write config through a temp file in the same directory and rename it into place.
+
+    Readers see either the old file or the complete new one, never a partial write.
+    """
+    config_dir = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=config_dir)
+    try:
+        with os.fdopen(fd, 'w') as config_file:
+            json.dump(config, config_file, indent=4)
+            config_file.flush()
+            os.fsync(config_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def config_pairs(config):
+    return list(zip(config.get('source_dirs', []), config.get('dest_dirs', [])))
+
+def diff_pairs(old_config, new_config):
+    """Return (added, removed) source/dest pairs between two configurations."""
+    old_pairs = config_pairs(old_config or {})
+    new_pairs = config_pairs(new_config)
+    added = [pair for pair in new_pairs if pair not in old_pairs]
+    removed = [pair for pair in old_pairs if pair not in new_pairs]
+    return added, removed
+
+class ConfigManager:
+    """Holds the running configuration and reloads it only when the file changes.
+
+    A change is detected from the file's inode, mtime and size, so an unchanged
+    file costs one stat per cycle. A new file that fails to parse or validate is
+    logged once and the running configuration is kept.
+    """
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.config = None
+        self._signature = None
+
+    def _stat_signature(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def reload_if_changed(self):
+        """Reload a changed file; return (added pairs, removed pairs), or None if nothing was applied.
+
+        Raises when there is no running configuration to fall back on.
+        """
+        signature = None
+        try:
+            signature = self._stat_signature()
+            if signature == self._signature:
+                return None
+            new_config = read_config(self.path)
+        except (OSError, ValueError) as e:
+            if self.config is None:
+                raise
+            self._signature = signature  # report a broken file once, not every cycle
+            logging.error(f"Error reloading configuration, keeping the running one: {e}")
+            return None
+        self._signature = signature
+        added, removed = diff_pairs(self.config, new_config)
+        self.config = new_config
+        return added, removed
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import threading
+
+PID_FILE = 'backupFoldersFiles.pid'
+CONTROL_ADDRESS_FILE = 'backupFoldersFiles.control'  # where clients find the control socket
+CONTROL_TIMEOUT = 2.0  # seconds a client waits for the daemon to answer
+MAX_REQUEST = 64 * 1024
+LOCK_OFFSET = 1 << 20  # msvcrt locks are mandatory, so lock a byte past the PID to keep it readable
+
+class DaemonAlreadyRunning(RuntimeError):
+    """Another daemon holds the PID lock file."""
+
+def _lock_fd(fd):
+    """Take a non-blocking exclusive lock on fd; False if someone else holds it."""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+class DaemonLock:
+    """Exclusive lock file holding the daemon's PID.
+
+    The OS releases the lock when the process dies, so a PID file left behind
+    by a crash never blocks the next start.
+    """
+
+    def __init__(self, path=PID_FILE):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not _lock_fd(fd):
+            os.close(fd)
+            raise DaemonAlreadyRunning(f"backup daemon already running (PID {read_pid(self.path)})")
+        os.ftruncate(fd, 0)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, f"{os.getpid()}\n".encode('ascii'))
+        os.fsync(fd)
+        self._fd = fd
+        return self
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # closing the descriptor drops the lock
+            self._fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+def read_pid(path=PID_FILE):
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip() or 0) or None
+    except (OSError, ValueError):
+        return None
+
+def lock_is_held(path=PID_FILE):
+    """True if a live daemon holds the PID lock (checked by trying to take it)."""
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        return not _lock_fd(fd)
+    finally:
+        os.close(fd)
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST))
+            if request.get('token') != self.server.token:
+                response = {'ok': False, 'error': 'bad token'}
+            else:
+                handler = self.server.commands.get(request.get('command'))
+                if handler is None:
+                    response = {'ok': False, 'error': f"unknown command: {request.get('command')}"}
+                else:
+                    response = {'ok': True, 'result': handler()}
+        except Exception as e:
+            logging.error(f"Error handling control request: {e}")
+            response = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(response, default=str).encode('utf-8') + b'\n')
+
+class _UnixControlServer(getattr(socketserver, 'ThreadingUnixStreamServer', object)):
+    daemon_threads = True
+
+class _TcpControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+class ControlServer:
+    """Local control channel: answers JSON-line commands such as status, progress, trigger and stop.
+
+    Uses a Unix domain socket next to the address file where the platform has
+    them, otherwise a TCP socket on 127.0.0.1. The address file tells clients
+    where to connect and holds a random token every request must carry; it is
+    readable by the owner only.
+    """
+
+    def __init__(self, commands, address_file=CONTROL_ADDRESS_FILE):
+        self.commands = commands
+        self.address_file = address_file
+        self._server = None
+
+    def start(self):
+        token = secrets.token_hex(16)
+        if hasattr(socket, 'AF_UNIX'):
+            path = os.path.abspath(self.address_file) + '.sock'
+            if os.path.exists(path):
+                os.remove(path)  # left by a daemon that died; we hold the PID lock
+            self._server = _UnixControlServer(path, _ControlHandler)
+            os.chmod(path, 0o600)
+            address = {'family': 'unix', 'path': path, 'token': token}
+        else:
+            self._server = _TcpControlServer(('127.0.0.1', 0), _ControlHandler)
+            address = {'family': 'tcp', 'host': '127.0.0.1', 'port': self._server.server_address[1], 'token': token}
+        self._server.token = token
+        self._server.commands = self.commands
+        fd = os.open(self.address_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(address, f)
+        threading.Thread(target=self._server.serve_forever, name='ControlServer', daemon=True).start()
+        return self
+
+    def close(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        for path in (self.address_file, os.path.abspath(self.address_file) + '.sock'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def send_command(command, address_file=CONTROL_ADDRESS_FILE, timeout=CONTROL_TIMEOUT):
+    """Send one command to the daemon; return its result, or None if no daemon answers."""
+    try:
+        with open(address_file, 'r') as f:
+            address = json.load(f)
+        if address['family'] == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            target = address['path']
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            target = (address['host'], address['port'])
+        with sock:
+            sock.settimeout(timeout)
+            sock.connect(target)
+            sock.sendall(json.dumps({'command': command, 'token': address['token']}).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reader:
+                response = json.loads(reader.readline())
+    except (OSError, ValueError, KeyError):
+        return None
+    if not response.get('ok'):
+        raise RuntimeError(response.get('error'))
+    return response.get('result')
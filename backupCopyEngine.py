@@ -0,0 +1,154 @@
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+COPY_CHUNK_SIZE = 1024 * 1024  # 1 MiB buffers keep spinning disks streaming
+FICLONE = 0x40049409  # ioctl(dest_fd, FICLONE, src_fd) shares extents on btrfs/XFS
+
+BACKEND_BUFFERED = 'buffered'
+BACKEND_AUTO = 'auto'  # reflink where the filesystem shares extents, else hash-while-copy
+BACKEND_KERNEL = 'kernel'  # every kernel path, for sources that are cached or on a server-side-copy filesystem
+KERNEL_BACKENDS = ('reflink', 'copy_file_range', 'sendfile')
+AUTO_BACKENDS = ('reflink',)
+
+# errors meaning "this backend cannot work here", as opposed to a real I/O failure
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF}
+
+class ShortCopy(OSError):
+    """A kernel copy stopped before the expected size, e.g. because the source shrank."""
+
+# (backend, src_dev, dest_dev) combinations that failed once and are not retried
+_unsupported = set()
+_unsupported_lock = threading.Lock()
+
+def copy_file_with_checksum(src_file, dest_file, chunk_size=COPY_CHUNK_SIZE):
+    """Copy src_file to dest_file in one pass and return the MD5 checksum of the data.
+
+    The digest is computed from the same buffers that are written, so the source is
+    read exactly once. Metadata is preserved the same way shutil.copy2 does.
+    """
+    try:
+        md5 = hashlib.md5()
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        with open(src_file, 'rb') as f_in, open(dest_file, 'wb') as f_out:
+            while True:
+                read = f_in.readinto(buffer)
+                if not read:
+                    break
+                md5.update(view[:read])
+                f_out.write(view[:read])
+        shutil.copystat(src_file, dest_file)
+        return md5.hexdigest()
+    except Exception as e:
+        logging.error(f"Error copying {src_file} -> {dest_file}: {e}")
+        raise
+
+def file_checksum(file_path, chunk_size=COPY_CHUNK_SIZE):
+    """MD5 of a file read with large buffers."""
+    md5 = hashlib.md5()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb') as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            md5.update(view[:read])
+    return md5.hexdigest()
+
+def _reflink(src_fd, dest_fd, size):
+    fcntl.ioctl(dest_fd, FICLONE, src_fd)
+
+def _copy_file_range(src_fd, dest_fd, size):
+    copied = 0
+    while copied < size:
+        sent = os.copy_file_range(src_fd, dest_fd, size - copied)
+        if sent == 0:
+            raise ShortCopy(f"copy_file_range stopped at {copied} of {size} bytes")
+        copied += sent
+
+def _sendfile(src_fd, dest_fd, size):
+    copied = 0
+    while copied < size:
+        sent = os.sendfile(dest_fd, src_fd, None, size - copied)
+        if sent == 0:
+            raise ShortCopy(f"sendfile stopped at {copied} of {size} bytes")
+        copied += sent
+
+_KERNEL_COPIERS = {
+    'reflink': _reflink if fcntl is not None else None,
+    'copy_file_range': _copy_file_range if hasattr(os, 'copy_file_range') else None,
+    'sendfile': _sendfile if hasattr(os, 'sendfile') else None,
+}
+
+def _kernel_copy(src_file, dest_file, size, backends=KERNEL_BACKENDS):
+    """Try the kernel copy paths in order; return the backend used or None.
+
+    A backend that reports it cannot work here, or whose copy comes up short,
+    gives way to the next one; any other error (ENOSPC, EIO, ...) is raised.
+    """
+    with open(src_file, 'rb') as f_in, open(dest_file, 'wb') as f_out:
+        src_fd, dest_fd = f_in.fileno(), f_out.fileno()
+        devices = (os.fstat(src_fd).st_dev, os.fstat(dest_fd).st_dev)
+        for backend in backends:
+            copier = _KERNEL_COPIERS[backend]
+            if copier is None or (backend, *devices) in _unsupported:
+                continue
+            try:
+                copier(src_fd, dest_fd, size)
+                return backend
+            except ShortCopy as e:
+                logging.warning(f"{e} copying {src_file}; trying the next copy method")
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                with _unsupported_lock:
+                    _unsupported.add((backend, *devices))
+            # Start over cleanly for the next backend
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            os.lseek(dest_fd, 0, os.SEEK_SET)
+            os.ftruncate(dest_fd, 0)
+    return None
+
+def reflink_file(src_file, dest_file, size):
+    """Clone src_file as dest_file with FICLONE and return its checksum, or None where extents cannot be shared."""
+    if size <= 0 or _kernel_copy(src_file, dest_file, size, AUTO_BACKENDS) is None:
+        return None
+    shutil.copystat(src_file, dest_file)
+    return file_checksum(src_file)
+
+def copy_file(src_file, dest_file, backend=BACKEND_AUTO, size=None):
+    """Copy src_file to dest_file and return (checksum, backend used).
+
+    The manifest needs the checksum right away, so by default ('auto') only a
+    reflink (FICLONE) is tried: it shares extents instead of copying, and the
+    checksum read that follows is the only read of the source. Otherwise the
+    single-pass hash-while-copy is used, which also reads the source once.
+    'kernel' tries os.copy_file_range and os.sendfile as well; they keep the data
+    out of Python but the checksum then reads the source a second time, which
+    only pays off when it is cached or the filesystem copies server-side.
+    'buffered' always hashes while copying. Metadata is preserved like
+    shutil.copy2.
+    """
+    try:
+        if size is None:
+            size = os.stat(src_file).st_size
+        backends = {BACKEND_AUTO: AUTO_BACKENDS, BACKEND_KERNEL: KERNEL_BACKENDS}.get(backend)
+        if backends and size > 0:
+            used = _kernel_copy(src_file, dest_file, size, backends)
+            if used is not None:
+                shutil.copystat(src_file, dest_file)
+                return file_checksum(src_file), used
+        return copy_file_with_checksum(src_file, dest_file), BACKEND_BUFFERED
+    except Exception as e:
+        logging.error(f"Error copying {src_file} -> {dest_file}: {e}")
+        raise
@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+import zlib
+
+from backupManifest import is_unchanged
+from backupResume import temp_path_for
+
+CHUNKS_DIR = 'chunks'
+RECIPES_DIR = 'recipes'
+RECIPE_SUFFIX = '.recipe'
+MIN_CHUNK_SIZE = 16 * 1024
+AVG_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+READ_SIZE = 4 * 1024 * 1024
+ANCHOR_WIDTH = 4  # bytes mixed into the anchor value of each position
+WINDOW_SIZE = 32  # bytes before an anchor that are hashed to confirm a cut
+
+def _anchor_tables():
+    """One byte translation per anchor byte, derived deterministically so chunk cuts are stable."""
+    tables = [bytes(hashlib.sha256(f"anchor-{k}-{i}".encode('ascii')).digest()[0] for i in range(256))
+              for k in range(ANCHOR_WIDTH)]
+    # A run of one repeated byte must never mix to 0, or zero-filled regions would be all anchors
+    last = bytearray(tables[-1])
+    for value in range(256):
+        mixed = 0
+        for table in tables:
+            mixed ^= table[value]
+        if not mixed:
+            last[value] ^= 0x5a
+    tables[-1] = bytes(last)
+    return tables
+
+ANCHOR_TABLES = _anchor_tables()
+
+def _anchor_values(data):
+    """Byte i is a hash of data[i:i + ANCHOR_WIDTH], computed with translate and one big-int XOR per table."""
+    mixed = 0
+    for offset, table in enumerate(ANCHOR_TABLES):
+        mixed ^= int.from_bytes(data[offset:].translate(table), 'little')
+    return mixed.to_bytes(len(data), 'little')
+
+def chunk_boundaries(data, min_size=MIN_CHUNK_SIZE, avg_size=AVG_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    """Yield chunk end offsets for data using content-defined chunking.
+
+    Positions whose anchor value (a hash of the next ANCHOR_WIDTH bytes) is 0 are
+    candidate cuts, about 1 in 256; a candidate is cut when the CRC32 of the
+    WINDOW_SIZE bytes before it is also zero under a mask. Boundaries therefore
+    follow the content: an insertion only changes the chunks around it. Anchor
+    values are computed for the whole buffer at C speed and only candidates are
+    hashed, so a buffer is chunked at tens of MB/s rather than the few MB/s of a
+    per-byte rolling hash in Python. Cuts before min_size are never considered,
+    and chunks never exceed max_size. The last offset yielded is always len(data).
+    """
+    mask = (1 << max(avg_size.bit_length() - 9, 0)) - 1  # the anchor test already passes 1 in 2**8
+    anchors = _anchor_values(data)
+    crc32 = zlib.crc32
+    length = len(data)
+    last_anchor = length - ANCHOR_WIDTH  # later anchor values are cut short by the end of data
+    start = 0
+    while start < length:
+        end = min(start + max_size, length)
+        cut = end
+        pos = start + max(min_size, 1)
+        while True:
+            anchor = anchors.find(0, pos, min(end, last_anchor + 1))
+            if anchor < 0:
+                break
+            if not crc32(data[max(anchor - WINDOW_SIZE, 0):anchor]) & mask:
+                cut = anchor
+                break
+            pos = anchor + 1
+        yield cut
+        start = cut
+
+def iter_chunks(file_path):
+    """Stream (chunk bytes) for a file without loading it whole into memory."""
+    with open(file_path, 'rb') as f:
+        pending = b''
+        while True:
+            data = f.read(READ_SIZE)
+            eof = not data
+            pending += data
+            start = 0
+            for end in chunk_boundaries(pending):
+                # The final chunk of the buffer may be cut short by the buffer end; keep it for the next read
+                if end == len(pending) and not eof:
+                    break
+                yield pending[start:end]
+                start = end
+            pending = pending[start:]
+            if eof:
+                if pending:
+                    yield pending
+                return
+
+class DedupStore:
+    """Chunk-level deduplicating destination.
+
+    Files are split with a content-defined chunker; every unique chunk is stored
+    once under chunks/ab/<sha256> and each file gets a recipe under recipes/ that
+    lists its chunks in order. Near-duplicate files (re-encodes, rotated dumps,
+    copies of a project) then share most of their chunks.
+    """
+
+    def __init__(self, dest_dir):
+        self.dest_dir = dest_dir
+        self.chunks_dir = os.path.join(dest_dir, CHUNKS_DIR)
+        self.dest_root = os.path.join(dest_dir, RECIPES_DIR)
+        self._lock = threading.Lock()  # makes the new-chunk check and rename one step across workers
+        os.makedirs(os.path.join(self.chunks_dir, 'tmp'), exist_ok=True)
+        os.makedirs(self.dest_root, exist_ok=True)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _store_chunk(self, chunk):
+        """Store chunk if it is new; return (digest, bytes written).
+
+        Workers storing the same new chunk at once may both write a temp file,
+        but only the one that renames it into place counts the bytes.
+        """
+        digest = hashlib.sha256(chunk).hexdigest()
+        chunk_file = self.chunk_path(digest)
+        if os.path.exists(chunk_file):
+            return digest, 0
+        os.makedirs(os.path.dirname(chunk_file), exist_ok=True)
+        temp_file = os.path.join(self.chunks_dir, 'tmp', uuid.uuid4().hex)
+        with open(temp_file, 'wb') as f:
+            f.write(chunk)
+        with self._lock:
+            if os.path.exists(chunk_file):
+                os.remove(temp_file)
+                return digest, 0
+            os.replace(temp_file, chunk_file)
+        return digest, len(chunk)
+
+    def backup(self, src_file, dest_file, rel_file, src_stat, manifest, options):
+        """Chunk src_file into the store and write its recipe.
+
+        Returns None when the recipe is already current, otherwise
+        (checksum, 'dedup', bytes of new chunk data written).
+        """
+        recipe_file = dest_file + RECIPE_SUFFIX
+        entry = manifest.get(rel_file)
+        if entry is not None:
+            try:
+                if is_unchanged(entry, src_stat, os.stat(recipe_file)):
+                    return None
+            except FileNotFoundError:
+                pass
+
+        md5 = hashlib.md5()
+        lines = []
+        written = 0
+        for chunk in iter_chunks(src_file):
+            md5.update(chunk)
+            digest, new_bytes = self._store_chunk(chunk)
+            written += new_bytes
+            lines.append(f"{digest} {len(chunk)}\n")
+        checksum = md5.hexdigest()
+
+        temp_recipe = temp_path_for(recipe_file)
+        with open(temp_recipe, 'w') as f:
+            f.write(f"{src_stat.st_size} {checksum}\n")
+            f.writelines(lines)
+        shutil.copystat(src_file, temp_recipe)
+        os.replace(temp_recipe, recipe_file)
+        manifest.record(rel_file, src_stat, checksum, os.stat(recipe_file))
+        return checksum, 'dedup', written
+
+    def restore_file(self, rel_file, out_file):
+        """Rebuild rel_file from its recipe into out_file, one chunk at a time.
+
+        Returns the MD5 checksum of the restored data after checking it against the recipe.
+        """
+        recipe_file = os.path.join(self.dest_root, rel_file) + RECIPE_SUFFIX
+        md5 = hashlib.md5()
+        try:
+            with open(recipe_file, 'r') as recipe, open(out_file, 'wb') as f_out:
+                _size, expected = recipe.readline().split()
+                for line in recipe:
+                    digest, _length = line.split()
+                    with open(self.chunk_path(digest), 'rb') as chunk_file:
+                        chunk = chunk_file.read()
+                    md5.update(chunk)
+                    f_out.write(chunk)
+            shutil.copystat(recipe_file, out_file)
+            if md5.hexdigest() != expected:
+                raise ValueError(f"Checksum mismatch restoring {rel_file}")
+            return expected
+        except Exception as e:
+            logging.error(f"Error restoring {rel_file} to {out_file}: {e}")
+            raise
+
+def dedup_ratio(stats):
+    """Logical bytes backed up per byte of new chunk data written, from a run's BackupStats."""
+    written = stats.get('bytes_transferred')
+    return stats.get('bytes_copied') / written if written else float('inf')
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import shutil
+import zlib
+
+DELTA_BLOCK_SIZE = 64 * 1024
+DELTA_THRESHOLD = 64 * 1024 * 1024  # files smaller than this are simply copied
+MAX_LITERAL_RATIO = 0.5  # give up on the delta once this much of the file is new data
+MAX_LITERAL_BLOCKS = 8  # ...or once this many blocks in a row match nothing
+READ_SIZE = 4 * 1024 * 1024
+ADLER_MOD = 65521
+DELTA_TEMP_SUFFIX = '.delta-tmp'
+
+class DeltaAborted(Exception):
+    """Raised when the source differs too much from the destination for a delta to pay off."""
+
+def block_signatures(dest_file, block_size=DELTA_BLOCK_SIZE):
+    """Return {weak adler32: [(block index, md5 digest), ...]} for every full block of dest_file."""
+    signatures = {}
+    with open(dest_file, 'rb') as f:
+        index = 0
+        while True:
+            block = f.read(block_size)
+            if len(block) < block_size:
+                break
+            signatures.setdefault(zlib.adler32(block), []).append((index, hashlib.md5(block).digest()))
+            index += 1
+    return signatures
+
+def delta_copy(src_file, dest_file, block_size=DELTA_BLOCK_SIZE, max_literal_ratio=MAX_LITERAL_RATIO, publish=None):
+    """Update dest_file to match src_file, transferring only the regions that changed.
+
+    Works like rsync: blocks of the existing destination are indexed by a weak
+    adler32 and a strong MD5; the source is scanned with a rolling adler32 so that
+    matching blocks are found at any offset, even after insertions. Matching blocks
+    are copied from the old destination, everything else is written as literal
+    data. The result is built in a temp file beside the destination and renamed
+    over it, or handed to publish(temp_file, checksum) to do that. Returns
+    (checksum, literal bytes transferred). Raises DeltaAborted when more than
+    max_literal_ratio of the source turns out to be new data, or when
+    MAX_LITERAL_BLOCKS blocks in a row match nothing, so that rewritten files cost
+    little more than a plain copy.
+    """
+    src_size = os.stat(src_file).st_size
+    max_literal = int(src_size * max_literal_ratio)
+    max_literal_run = MAX_LITERAL_BLOCKS * block_size
+    signatures = block_signatures(dest_file, block_size)
+    dest_dir, dest_name = os.path.split(dest_file)
+    temp_file = os.path.join(dest_dir, f".{dest_name}{DELTA_TEMP_SUFFIX}")
+    md5 = hashlib.md5()
+    transferred = 0
+    try:
+        with open(src_file, 'rb') as f_src, open(dest_file, 'rb') as f_old, open(temp_file, 'wb') as f_out:
+            def emit(data):
+                md5.update(data)
+                f_out.write(data)
+
+            buf = f_src.read(READ_SIZE)
+            eof = len(buf) < READ_SIZE
+            pos = 0
+            literal = bytearray()
+            literal_run = 0
+            a = b = None
+            while True:
+                if not eof and len(buf) - pos <= block_size:
+                    chunk = f_src.read(READ_SIZE)
+                    eof = len(chunk) < READ_SIZE
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                if len(buf) - pos < block_size:
+                    literal += buf[pos:]  # a tail shorter than a block is always sent as data
+                    break
+
+                if a is None:
+                    weak = zlib.adler32(buf[pos:pos + block_size])
+                    a, b = weak & 0xffff, weak >> 16
+                match = None
+                candidates = signatures.get((b << 16) | a)
+                if candidates:
+                    strong = hashlib.md5(buf[pos:pos + block_size]).digest()
+                    match = next((index for index, digest in candidates if digest == strong), None)
+
+                if match is not None:
+                    if literal:
+                        emit(literal)
+                        transferred += len(literal)
+                        literal = bytearray()
+                    literal_run = 0
+                    f_old.seek(match * block_size)
+                    emit(f_old.read(block_size))
+                    pos += block_size
+                    a = None
+                    continue
+
+                # No match: slide the window one byte and roll the weak checksum
+                out_byte = buf[pos]
+                literal.append(out_byte)
+                literal_run += 1
+                pos += 1
+                if pos + block_size <= len(buf):
+                    in_byte = buf[pos + block_size - 1]
+                    a = (a - out_byte + in_byte) % ADLER_MOD
+                    b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+                else:
+                    a = None
+                if transferred + len(literal) > max_literal or literal_run > max_literal_run:
+                    raise DeltaAborted(f"{src_file} differs too much from {dest_file}")
+                if len(literal) >= READ_SIZE:
+                    emit(literal)
+                    transferred += len(literal)
+                    literal = bytearray()
+
+            if literal:
+                emit(literal)
+                transferred += len(literal)
+        shutil.copystat(src_file, temp_file)
+        if publish is None:
+            os.replace(temp_file, dest_file)
+        else:
+            publish(temp_file, md5.hexdigest())
+        return md5.hexdigest(), transferred
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
@@ -0,0 +1,229 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import stat
+import sys
+import threading
+
+DURABILITY_NONE = 'none'  # rename into place; the OS writes the data back whenever it likes
+DURABILITY_BATCH = 'batch'  # flush and publish in groups: one filesystem sync before and one after the renames
+DURABILITY_STRICT = 'strict'  # fsync every file and its directory before moving on
+DURABILITY_LEVELS = (DURABILITY_NONE, DURABILITY_BATCH, DURABILITY_STRICT)
+BATCH_FILES = 256  # files held back before a batch is flushed
+BATCH_BYTES = 256 * 1024 * 1024  # ...or bytes
+
+_datasync = getattr(os, 'fdatasync', os.fsync)  # the data and size are what must survive, not the mtime
+_libc = None
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.syncfs.argtypes = [ctypes.c_int]
+    return _libc
+
+def syncfs_available():
+    """True on Linux with a libc that exposes syncfs(2)."""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return hasattr(_load_libc(), 'syncfs')
+    except OSError:
+        return False
+
+def syncfs(path):
+    """Write back and wait for all dirty data of the filesystem holding path."""
+    fd = os.open(path or '.', os.O_RDONLY)
+    try:
+        if _load_libc().syncfs(fd) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+    finally:
+        os.close(fd)
+
+def fsync_file(path):
+    """Flush path's data to disk; it may already carry a read-only mode copied from its source.
+
+    POSIX syncs through a read-only descriptor. Windows needs a writable handle,
+    so a read-only file is made writable for the flush and restored after.
+    """
+    if os.name != 'nt':
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            _datasync(fd)
+        finally:
+            os.close(fd)
+        return
+    mode = os.stat(path).st_mode
+    if not mode & stat.S_IWRITE:
+        os.chmod(path, mode | stat.S_IWRITE)
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_BINARY)
+        try:
+            _datasync(fd)
+        finally:
+            os.close(fd)
+    finally:
+        if not mode & stat.S_IWRITE:
+            os.chmod(path, mode)
+
+def fsync_dir(path):
+    """Make renames in path durable; a no-op on Windows, where directories cannot be opened."""
+    if os.name == 'nt':
+        return
+    fd = os.open(path or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class _Pending:
+    __slots__ = ('temp_file', 'dest_file', 'on_published', 'on_failed')
+
+    def __init__(self, temp_file, dest_file, on_published, on_failed):
+        self.temp_file = temp_file
+        self.dest_file = dest_file
+        self.on_published = on_published
+        self.on_failed = on_failed
+
+    def failed(self, error):
+        _remove_quietly(self.temp_file)
+        if self.on_failed is not None:
+            self.on_failed(error)
+        else:
+            logging.error(f"Error publishing {self.temp_file} as {self.dest_file}: {error}")
+
+    def published(self):
+        if self.on_published is not None:
+            try:
+                self.on_published()
+            except Exception as e:
+                self.failed(e)
+
+class Publisher:
+    """Moves finished temp files over their destination at the configured durability level.
+
+    on_published callbacks (e.g. recording the file in the manifest) run only
+    once the file is in place and, for batch and strict, on disk, so nothing is
+    recorded as backed up before it would survive a power cut. In batch mode
+    files wait until batch_files or batch_bytes accumulate or flush() is called.
+    On Linux a batch then costs one syncfs of each destination filesystem before
+    the renames and one after, whatever its size; elsewhere each file is
+    fdatasynced and each directory fsynced once. A file of a batch that cannot
+    be published has its temp file removed and on_failed(error) called instead;
+    at the other levels the error is raised from publish().
+    """
+
+    def __init__(self, level=DURABILITY_NONE, batch_files=BATCH_FILES, batch_bytes=BATCH_BYTES):
+        if level not in DURABILITY_LEVELS:
+            logging.error(f"Unknown durability level {level!r}, using {DURABILITY_BATCH}")
+            level = DURABILITY_BATCH
+        self.level = level
+        self.batch_files = batch_files
+        self.batch_bytes = batch_bytes
+        self.use_syncfs = syncfs_available()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_bytes = 0
+
+    def publish(self, temp_file, dest_file, size=0, on_published=None, on_failed=None):
+        if self.level == DURABILITY_BATCH:
+            with self._lock:
+                self._pending.append(_Pending(temp_file, dest_file, on_published, on_failed))
+                self._pending_bytes += size
+                if len(self._pending) < self.batch_files and self._pending_bytes < self.batch_bytes:
+                    return
+                batch = self._take()
+            self._flush(batch)
+            return
+        if self.level == DURABILITY_STRICT:
+            fsync_file(temp_file)
+        os.replace(temp_file, dest_file)
+        if self.level == DURABILITY_STRICT:
+            fsync_dir(os.path.dirname(dest_file))
+        if on_published is not None:
+            on_published()
+
+    def flush(self):
+        """Publish every file still held back by batch mode."""
+        with self._lock:
+            batch = self._take()
+        self._flush(batch)
+
+    def _take(self):
+        batch, self._pending, self._pending_bytes = self._pending, [], 0
+        return batch
+
+    def _flush(self, batch):
+        by_dir = {}  # dest dir -> pending files
+        for item in batch:
+            by_dir.setdefault(os.path.dirname(item.dest_file), []).append(item)
+        by_device = {}  # st_dev -> {dest dir: pending files}
+        for dest_dir, items in by_dir.items():
+            try:
+                device = os.stat(dest_dir or '.').st_dev if self.use_syncfs else None
+            except OSError as e:
+                for item in items:
+                    item.failed(e)
+                continue
+            by_device.setdefault(device, {})[dest_dir] = items
+        for dirs in by_device.values():
+            self._flush_device(dirs)
+
+    def _flush_device(self, dirs):
+        """Publish the pending files of directories on one filesystem."""
+        sync_path = next(iter(dirs)) if self.use_syncfs else None
+        synced = {}
+        if sync_path is not None:
+            try:
+                syncfs(sync_path)
+                synced = dirs
+            except OSError as e:
+                logging.error(f"Error flushing the filesystem of {sync_path or '.'}, syncing files one by one: {e}")
+                sync_path = None
+        if not synced:
+            for dest_dir, items in dirs.items():
+                synced[dest_dir] = []
+                for item in items:
+                    try:
+                        fsync_file(item.temp_file)
+                        synced[dest_dir].append(item)
+                    except OSError as e:
+                        item.failed(e)
+
+        renamed = {}
+        for dest_dir, items in synced.items():
+            renamed[dest_dir] = []
+            for item in items:
+                try:
+                    os.replace(item.temp_file, item.dest_file)
+                    renamed[dest_dir].append(item)
+                except OSError as e:
+                    item.failed(e)
+
+        if sync_path is not None:
+            try:
+                syncfs(sync_path)
+            except OSError as e:
+                logging.error(f"Error flushing the filesystem of {sync_path or '.'}, syncing directories: {e}")
+                sync_path = None
+        for dest_dir, items in renamed.items():
+            if sync_path is None and items:
+                try:
+                    fsync_dir(dest_dir)
+                except OSError as e:
+                    # The files are in place but may not survive a crash; leave them unrecorded
+                    for item in items:
+                        if item.on_failed is not None:
+                            item.on_failed(e)
+                    logging.error(f"Error flushing directory {dest_dir} to disk: {e}")
+                    continue
+            for item in items:
+                item.published()
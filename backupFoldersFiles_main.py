@@ -1,18 +1,70 @@
-from datetime import datetime
-import gzip
+import argparse
 import os
+import signal
+import sys
+import threading
 from threading import Thread
 import time
-import shutil
 import hashlib
 import logging
 import json
+import queue
+from backupCompression import COMPRESSION_SUFFIXES, CompressedStore, shutdown_compression_pools
+from backupConfig import CONFIG_FILE, ConfigError, ConfigManager
+from backupControl import CONTROL_ADDRESS_FILE, PID_FILE, ControlServer, DaemonAlreadyRunning, DaemonLock
+from backupCopyEngine import BACKEND_AUTO
+from backupDedupStore import DedupStore, dedup_ratio
+from backupDeltaSync import DELTA_BLOCK_SIZE, DELTA_THRESHOLD, DeltaAborted, delta_copy
+from backupDurability import BATCH_BYTES, BATCH_FILES, DURABILITY_BATCH, Publisher
+from backupJobScheduler import Scheduler
+from backupLogging import DEFAULT_VERBOSITY, VERBOSITY_FILES, VERBOSITY_SUMMARY, setup_logging
+from backupLogRotation import (LOG_MAX_BYTES, LOG_RETENTION_BYTES, LOG_RETENTION_DAYS, LOG_ROTATE_INTERVAL,
+                               LogRotator, RotatingBatchFileHandler, first_log_dir)
+from backupLogStore import LOG_STORE_FILE, LogStore, LogStoreHandler
+from backupManifest import BackupManifest, MANIFEST_DIR, is_unchanged, manifest_path_for
+from backupMetrics import METRICS_PORT, MetricsRegistry, MetricsServer
+from backupPackStore import PACK_THRESHOLD, SEGMENT_SIZE, PackStore
+from backupPairScheduler import run_pairs
+from backupPlanner import (ACTION_DELETED, ACTION_UNCHANGED, DEFAULT_CHECK_RATE, DEFAULT_COPY_RATE, RATE_CHECK_KEY,
+                           RATE_COPY_KEY, plan_backup)
+from backupProfiler import (NULL_PROFILER, PROFILE_CPROFILE, PROFILE_DIR, PROFILE_OFF, PROFILE_PHASES,
+                            PROFILE_TRACE, CycleProfiler)
+from backupResume import (RESUME_BLOCK_SIZE, RESUME_THRESHOLD, copy_via_temp, discard_stale_transfers, resumable_copy,
+                          sweep_temp_files)
+from backupSnapshots import SNAPSHOT_KEEP, SnapshotStore
+from backupStats import BackupStats
+from backupWalker import DestDirCache, dest_dir_cache_for
+from backupWatcher import InotifyWatcher, inotify_available
+
+ERROR_LOG_FILE = 'error.log'
+WORK_QUEUE_DEPTH = 64  # queued files per worker before the walker blocks
+FULL_RESCAN_INTERVAL = 3600  # seconds between safety-net full rescans in watch mode
+ROTATION_CHECK_INTERVAL = 60  # seconds between error log rotation/retention checks
+LOG_SHIP_INTERVAL = 600  # seconds between sweeps that move stray rotated logs into log_dirs
+SCRUB_INTERVAL = 86400  # seconds between scrubs of backed-up files
+SCRUB_SAMPLE = 100  # files re-hashed per pair and scrub
+RATE_MIN_FILES = 100  # smallest plan whose timing updates the pair's measured check rate
+RATE_MIN_BYTES = 1024 * 1024  # smallest copy volume whose timing updates the measured copy rate
+_error_log_lock = threading.Lock()
+_swept_dests = set()  # destinations already cleared of temp files from before this process started
+_publish_lock = threading.Lock()  # joins a copy's return with its (possibly deferred) publish
+_watcher = None
+_rotator = None
+_last_full_scan = None
+_watch_active = False
+_new_pairs = []  # pairs added by a config reload that still need their first full backup
+_config_manager = ConfigManager(CONFIG_FILE)
+metrics = MetricsRegistry()  # live per-pair counters for the control channel and /metrics
+profiler = NULL_PROFILER  # phase timings of the cycle in progress when profiling is on
+_profile_capture = None  # cprofile/trace mode armed for the next cycle
+_started_at = time.time()
+config = {}
 
 def calculate_checksum(file_path):
     """Calculate MD5 checksum of a file."""
     try:
         md5 = hashlib.md5()
-        with open(file_path, 'rb') as f:
+        with profiler.phase('hash'), open(file_path, 'rb') as f:
             for chunk in iter(lambda: f.read(4096), b""):
                 md5.update(chunk)
         return md5.hexdigest()
@@ -20,155 +72,793 @@ def calculate_checksum(file_path):
         logging.error(f"Error calculating checksum for {file_path}: {e}")
         raise
 
-def get_permissions(file_path):
-    """Get file permissions."""
+def get_permissions(file_path, file_stat=None):
+    """Get file permissions, reusing file_stat when the caller already has it."""
     try:
-        return oct(os.stat(file_path).st_mode)[-3:]
+        if file_stat is None:
+            file_stat = os.stat(file_path)
+        return oct(file_stat.st_mode)[-3:]
     except Exception as e:
         logging.error(f"Error getting permissions for {file_path}: {e}")
         raise
 
-def is_file_changed(src_file, dest_file):
-    """Check if the file has changed by comparing checksum and modification time."""
+def is_file_changed(src_file, dest_file, manifest=None, rel_path=None, src_stat=None, stats=None):
+    """Check if the file has changed by comparing checksum and modification time.
+
+    With a manifest, files whose stat tuple matches the recorded one are skipped
+    without hashing, and the destination is never re-read once it has been recorded.
+    A changed stat tuple is reported as changed without hashing, because the copy
+    computes the checksum from the same read. Bytes hashed are counted in stats.
+    """
     try:
-        if not os.path.exists(dest_file):
+        try:
+            dest_stat = os.stat(dest_file)
+        except FileNotFoundError:
+            return True
+
+        if manifest is None:
+            src_checksum = calculate_checksum(src_file)
+            dest_checksum = calculate_checksum(dest_file)
+            return src_checksum != dest_checksum
+
+        if src_stat is None:
+            src_stat = os.stat(src_file)
+        entry = manifest.get(rel_path)
+        if is_unchanged(entry, src_stat, dest_stat):
+            return False
+
+        if entry is not None:
+            # Source or destination was touched: let the single-pass copy re-hash it.
             return True
-        
+
         src_checksum = calculate_checksum(src_file)
+        # First time this pair is seen: one full comparison seeds the manifest.
         dest_checksum = calculate_checksum(dest_file)
-        
-        return src_checksum != dest_checksum
+        if stats is not None:
+            stats.add('bytes_hashed', src_stat.st_size + dest_stat.st_size)
+        if src_checksum == dest_checksum:
+            manifest.record(rel_path, src_stat, src_checksum, dest_stat)
+            return False
+        return True
     except Exception as e:
         logging.error(f"Error comparing files {src_file} and {dest_file}: {e}")
         return False
 
-def backup_files(src_dir, dest_dir):
-    """Backup files from src_dir to dest_dir with logging, excluding '.stfolder'."""
+def log_backup_error(error_message, pair=None, path=None):
+    """Write a per-file failure to the main log and the error log file.
+
+    pair and path are stored with the record in the searchable log store.
+    """
+    logging.error(error_message, extra={'pair': pair, 'path': path})
+    with _error_log_lock:
+        if _rotator is not None:
+            _rotator.rotate_if_due(ERROR_LOG_FILE, config.get('log_max_bytes', LOG_MAX_BYTES),
+                                   config.get('log_rotate_interval', LOG_ROTATE_INTERVAL))
+        with open(ERROR_LOG_FILE, 'a') as error_log:
+            error_log.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {error_message}\n")
+
+def transfer_file(src_file, dest_file, src_stat, options, manifest=None, rel_file=None, publisher=None,
+                  on_published=None, on_failed=None):
+    """Bring dest_file up to date with src_file; return (checksum, backend, bytes transferred).
+
+    Large files that already exist at the destination are updated with a block
+    delta. Other large files are reflinked where the filesystem allows it, or
+    copied through the manifest's transfer journal so an interrupted copy
+    resumes where it stopped; everything else goes through
+    the copy engine. Either way the new data is written to a temp file that the
+    publisher moves into place at the pair's durability level, and the file is
+    recorded in the manifest only after that. on_published() then runs too; in
+    batch mode that may be after this returns, and a publish that fails there
+    calls on_failed(error) instead.
+    """
+    publisher = publisher or Publisher()
+
+    def publish(temp_file, checksum, then=None):
+        def published():
+            if then is not None:
+                then()
+            if manifest is not None:
+                manifest.record(rel_file, src_stat, checksum, os.stat(dest_file))
+            if on_published is not None:
+                on_published()
+        publisher.publish(temp_file, dest_file, src_stat.st_size, published, on_failed)
+
+    delta_threshold = options.get('delta_threshold', DELTA_THRESHOLD)
+    if delta_threshold and src_stat.st_size >= delta_threshold and os.path.isfile(dest_file):
+        try:
+            checksum, transferred = delta_copy(src_file, dest_file, options.get('delta_block_size', DELTA_BLOCK_SIZE),
+                                               publish=publish)
+            return checksum, 'delta', transferred
+        except DeltaAborted:
+            pass  # mostly new content: a plain copy is cheaper
+    resume_threshold = options.get('resume_threshold', RESUME_THRESHOLD)
+    if manifest is not None and resume_threshold and src_stat.st_size >= resume_threshold:
+        return resumable_copy(src_file, dest_file, src_stat, manifest, rel_file,
+                              options.get('resume_block_size', RESUME_BLOCK_SIZE), publish=publish,
+                              backend=options.get('copy_backend', BACKEND_AUTO))
+    checksum, backend = copy_via_temp(src_file, dest_file, options.get('copy_backend', BACKEND_AUTO), src_stat.st_size,
+                                      publish)
+    return checksum, backend, src_stat.st_size
+
+def _count_copied(src_file, dest_file, src_stat, result, stats, verbosity, fields):
+    checksum, backend, transferred = result
+    stats.add(f'backend_{backend}')
+    stats.add('files_copied')
+    stats.add('bytes_copied', src_stat.st_size)
+    stats.add('bytes_transferred', transferred)
+    stats.add('bytes_hashed', src_stat.st_size)  # every backend checksums the source as it reads it
+    if verbosity == VERBOSITY_SUMMARY:
+        return
+    permissions = get_permissions(src_file, src_stat)
+    with profiler.phase('log'):
+        if backend == 'delta':
+            logging.info(f"Backed up file (delta): {src_file} -> {dest_file} | Checksum: {checksum} | "
+                         f"Permissions: {permissions} | Transferred: {transferred} of {src_stat.st_size} bytes",
+                         extra=fields)
+        else:
+            logging.info(f"Backed up file: {src_file} -> {dest_file} | Checksum: {checksum} | "
+                         f"Permissions: {permissions}", extra=fields)
+
+def backup_file(src_file, dest_file, rel_file, manifest, stats, src_stat=None, options=None, store=None,
+                publisher=None):
+    """Back up a single file; failures are logged and never propagate to the caller.
+
+    options is the backup configuration (e.g. copy_backend) for this pair. When a
+    store is given (e.g. a SnapshotStore), it decides whether the file changed and
+    how it is written, instead of the plain mirror copy. log_verbosity decides
+    which per-file lines are logged; the run summary always counts every file.
+    A plain copy is counted and logged only once the publisher has put it in place.
+    """
+    options = options or {}
+    verbosity = options.get('log_verbosity', DEFAULT_VERBOSITY)
+    fields = {'pair': f"{stats.src_dir} -> {stats.dest_dir}", 'path': src_file}
+
+    def failed(e):
+        stats.add('errors')
+        log_backup_error(f"Failed to back up file: {src_file} -> {dest_file} | Error: {e}", **fields)
+
+    try:
+        stats.add('files_scanned')
+        if src_stat is None:
+            with profiler.phase('stat'):
+                src_stat = os.stat(src_file)
+        if store is not None:
+            with profiler.phase('store'):
+                result = store.backup(src_file, dest_file, rel_file, src_stat, manifest, options)
+            if result is not None:
+                _count_copied(src_file, dest_file, src_stat, result, stats, verbosity, fields)
+        else:
+            with profiler.phase('compare'):
+                changed = is_file_changed(src_file, dest_file, manifest, rel_file, src_stat, stats)
+            result = None
+            if changed:
+                # The copy returning and the file being published happen in either order: batch
+                # durability publishes later, possibly from another worker. Count it once both have.
+                outcome = []
+
+                def finish(copy_result=None):
+                    with _publish_lock:
+                        outcome.append(copy_result)
+                        if len(outcome) < 2:
+                            return
+                    copy_result = outcome[0] or outcome[1]
+                    _count_copied(src_file, dest_file, src_stat, copy_result, stats, verbosity, fields)
+
+                with profiler.phase('copy'):
+                    result = transfer_file(src_file, dest_file, src_stat, options, manifest, rel_file, publisher,
+                                           finish, failed)
+                finish(result)
+
+        if result is None:
+            stats.add('files_unchanged')
+            if verbosity == VERBOSITY_FILES:
+                with profiler.phase('log'):
+                    logging.info(f"File unchanged, skipping backup: {src_file}", extra=fields)
+    except Exception as e:
+        failed(e)
+
+def _backup_worker(work_queue, manifest, stats, options, store, cycle_profiler, publisher):
+    with cycle_profiler.thread():
+        while True:
+            item = work_queue.get()
+            try:
+                if item is None:
+                    return
+                src_file, dest_file, rel_file, src_stat = item
+                with cycle_profiler.file(rel_file):
+                    backup_file(src_file, dest_file, rel_file, manifest, stats, src_stat, options, store, publisher)
+            finally:
+                work_queue.task_done()
+
+def execute_plan(plan, manifest=None, stats=None, workers=1, options=None, store=None, dir_cache=None,
+                 publisher=None):
+    """Apply a BackupPlan: back up its new and modified files and drop deleted ones from the manifest.
+
+    Unchanged files are only counted, because the plan already matched their stat
+    data against the manifest; with a store every file still goes through
+    store.backup, which checks its own objects. With workers > 1 the files are
+    fed through a bounded queue to a pool of threads that do the hashing and copying.
+    Files the publisher still holds back are published before deletions are applied.
+    """
+    options = options or {}
+    publisher = publisher or Publisher()
+    stats = stats or BackupStats(plan.src_dir, plan.dest_dir)
+    verbosity = options.get('log_verbosity', DEFAULT_VERBOSITY)
+    fields = {'pair': f"{stats.src_dir} -> {stats.dest_dir}"}
+    work_queue = None
+    threads = []
     try:
-        if not os.path.exists(dest_dir):
-            os.makedirs(dest_dir)
-        
-        for root, dirs, files in os.walk(src_dir):
-            # Skip the .stfolder directory
-            if '.stfolder' in dirs:
-                dirs.remove('.stfolder')
-            
-            relative_path = os.path.relpath(root, src_dir)
-            dest_path = os.path.join(dest_dir, relative_path)
-            
-            if not os.path.exists(dest_path):
-                os.makedirs(dest_path)
-            
-            for file in files:
-                src_file = os.path.join(root, file)
-                dest_file = os.path.join(dest_path, file)
-                
-                if is_file_changed(src_file, dest_file):
-                    try:
-                        checksum = calculate_checksum(src_file)
-                        permissions = get_permissions(src_file)
-                        
-                        shutil.copy2(src_file, dest_file)
-                        logging.info(f"Backed up file: {src_file} -> {dest_file} | Checksum: {checksum} | Permissions: {permissions}")
-                    except Exception as e:
-                        error_message = f"Failed to back up file: {src_file} -> {dest_file} | Error: {e}"
-                        logging.error(error_message)
-                        with open(ERROR_LOG_FILE, 'a') as error_log:
-                            error_log.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {error_message}\n")
+        if workers > 1:
+            work_queue = queue.Queue(maxsize=workers * WORK_QUEUE_DEPTH)
+            stats.work_queue = work_queue  # sampled for the queue depth metric
+            threads = [Thread(target=_backup_worker,
+                              args=(work_queue, manifest, stats, options, store, profiler, publisher), daemon=True)
+                       for _ in range(workers)]
+            for thread in threads:
+                thread.start()
+
+        for relative_path, entries, unchanged in plan.dirs:
+            if dir_cache is not None:
+                dir_cache.ensure(os.path.join(plan.dest_dir, relative_path) if relative_path else plan.dest_dir)
+            if unchanged:
+                stats.add('files_scanned', unchanged)
+                stats.add('files_unchanged', unchanged)
+            for action, _name, src_file, src_stat, dest_file, rel_file in entries:
+                if action == ACTION_UNCHANGED and store is None:
+                    stats.add('files_scanned')
+                    stats.add('files_unchanged')
+                    if verbosity == VERBOSITY_FILES:
+                        logging.info(f"File unchanged, skipping backup: {src_file}", extra=dict(fields, path=src_file))
+                elif work_queue is not None:
+                    with profiler.phase('enqueue'):
+                        work_queue.put((src_file, dest_file, rel_file, src_stat))
                 else:
-                    logging.info(f"File unchanged, skipping backup: {src_file}")
+                    with profiler.file(rel_file):
+                        backup_file(src_file, dest_file, rel_file, manifest, stats, src_stat, options, store,
+                                    publisher)
+
+        if work_queue is not None:
+            phase_started = time.monotonic()
+            with profiler.phase('drain'):
+                work_queue.join()
+            stats.set('drain_seconds', time.monotonic() - phase_started)
+
+        phase_started = time.monotonic()
+        with profiler.phase('publish'):
+            publisher.flush()
+        stats.set('publish_seconds', time.monotonic() - phase_started)
+
+        if manifest is not None:
+            phase_started = time.monotonic()
+            with profiler.phase('prune'):
+                # Stores that index paths themselves (pack mode) forget deleted files as well
+                store_remove = getattr(store, 'remove', None)
+                store_remove_tree = getattr(store, 'remove_tree', None)
+                if plan.full_scan:
+                    for rel_path, _size in plan.deleted:
+                        manifest.remove(rel_path)
+                        if store_remove is not None:
+                            store_remove(rel_path)
+                    stats.add('files_deleted', len(plan.deleted))
+                for rel_path in plan.missing:
+                    manifest.remove_tree(rel_path)
+                    if store_remove_tree is not None:
+                        store_remove_tree(rel_path)
+                if store is None:
+                    discard_stale_transfers(manifest, plan.src_dir)
+            stats.set('prune_seconds', time.monotonic() - phase_started)
+        return stats
+    finally:
+        for _ in threads:
+            work_queue.put(None)
+        for thread in threads:
+            thread.join()
+        publisher.flush()  # after an error, still publish (and record) what was copied
+
+def record_rates(manifest, plan, stats, execute_seconds):
+    """Remember how fast this pair was planned and copied, for the ETA of later plans."""
+    plan_seconds = stats.gauges().get('plan_seconds')
+    if plan_seconds and plan.file_count >= RATE_MIN_FILES:
+        manifest.set_meta(RATE_CHECK_KEY, plan.file_count / plan_seconds)
+    if execute_seconds and stats.get('bytes_copied') >= RATE_MIN_BYTES:
+        manifest.set_meta(RATE_COPY_KEY, stats.get('bytes_copied') / execute_seconds)
+
+def pair_rates(manifest):
+    """(copy bytes/s, files checked/s) measured for the pair, or the defaults before its first run."""
+    if manifest is None:
+        return DEFAULT_COPY_RATE, DEFAULT_CHECK_RATE
+    return manifest.get_meta(RATE_COPY_KEY, DEFAULT_COPY_RATE), manifest.get_meta(RATE_CHECK_KEY, DEFAULT_CHECK_RATE)
+
+def backup_files(src_dir, dest_dir, manifest=None, workers=1, rel_paths=None, options=None, store=None, plan=None):
+    """Backup files from src_dir to dest_dir with logging, excluding '.stfolder'.
+
+    The run is planned (plan_backup: stat data and the manifest only) and
+    executed (execute_plan). A plain mirror is planned in full first, and refused
+    before anything is copied if its new files and the growth of modified ones
+    do not fit on the destination; otherwise the plan is streamed. When
+    rel_paths is given (watch mode), only those files and directories are backed
+    up instead of the whole tree. options is the backup configuration passed down
+    to each file. A store (which needs the manifest) replaces the plain mirror,
+    and files are laid out under store.dest_root instead of dest_dir. plan, if
+    given, is a full plan the caller already made for that layout and is
+    executed as is. Returns the BackupStats of the run.
+    """
+    options = options or {}
+    stats = BackupStats(src_dir, dest_dir)
+    pair_key = f"{src_dir} -> {dest_dir}"
+    metrics.start_run(pair_key, stats, rel_paths is None)
+    if store is not None:
+        # Stores without a dest_root (pack mode) create the directories they need themselves
+        dir_cache = DestDirCache() if store.dest_root else None
+        dest_dir = store.dest_root or dest_dir
+    else:
+        dir_cache = dest_dir_cache_for(dest_dir)
+    try:
+        if dir_cache is not None:
+            if not os.path.isdir(dest_dir):
+                dir_cache.clear()  # destination root was removed; cached directories are stale
+            dir_cache.ensure(dest_dir)
+        # Snapshots are built in a fresh directory each cycle, so only mirrors and file-per-file stores are swept
+        if (dir_cache is not None and not isinstance(store, SnapshotStore) and manifest is not None
+                and rel_paths is None and dest_dir not in _swept_dests):
+            removed = sweep_temp_files(dest_dir, manifest)
+            if removed:
+                logging.info(f"Removed {removed} temp files of interrupted copies: {pair_key}",
+                             extra={'pair': pair_key})
+            _swept_dests.add(dest_dir)
+
+        # The walker skips the .stfolder directory. Without a free-space check nothing needs the
+        # whole plan up front, so it is streamed and copying overlaps the walk.
+        check_space = store is None and options.get('free_space_check', "Y") == "Y"
+        # Stores check unchanged files against their own objects (and snapshots link them), so they get every file
+        keep_unchanged = store is not None or options.get('log_verbosity', DEFAULT_VERBOSITY) == VERBOSITY_FILES
+        phase_started = time.monotonic()
+        if plan is None:
+            with profiler.phase('plan'):
+                plan = plan_backup(src_dir, dest_dir, manifest, rel_paths, store is not None, profiler.walk,
+                                   keep_unchanged, stream=not check_space)
+        if check_space:
+            stats.set('plan_seconds', time.monotonic() - phase_started)
+            stats.set('files_expected', plan.file_count)
+            totals = plan.totals()
+            if plan.bytes_to_copy or totals[ACTION_DELETED]['files']:
+                summary = ", ".join(f"{action}: {values['files']} ({values['bytes']} bytes)"
+                                    for action, values in totals.items())
+                logging.info(f"Backup plan: {pair_key} | {summary} | ETA: {plan.eta(*pair_rates(manifest)):.1f}s",
+                             extra={'pair': pair_key})
+            plan.check_free_space()
+
+        phase_started = time.monotonic()
+        publisher = Publisher(options.get('durability', DURABILITY_BATCH),
+                              options.get('durability_batch_files', BATCH_FILES),
+                              options.get('durability_batch_bytes', BATCH_BYTES))
+        execute_plan(plan, manifest, stats, workers, options, store, dir_cache, publisher)
+        execute_seconds = time.monotonic() - phase_started
+        stats.set('execute_seconds', execute_seconds)
+        if manifest is not None:
+            record_rates(manifest, plan, stats, execute_seconds)
+        if stats.get('errors') and dir_cache is not None:
+            dir_cache.clear()  # re-verify destination directories next cycle
+        logging.info(f"Backup summary: {stats.summary()}", extra={'pair': f"{stats.src_dir} -> {stats.dest_dir}"})
+        return stats
     except Exception as e:
         logging.error(f"Error during backup process from {src_dir} to {dest_dir}: {e}")
         raise
+    finally:
+        metrics.end_run(pair_key, stats, rel_paths is None)
 
-import os
-import gzip
-from datetime import datetime, timedelta
-
-def mtime(filepath):
-    return os.path.getmtime(filepath)
-
-def rotate_logs():
-    log_file = config.get('log_file', 'backup.log')
-    error_log_file = config.get('error_log_file', 'error.log')
-    one_day_ago = datetime.now().timestamp() - 86400  # 86400 seconds = 1 day
-
-    # Check if log_file exists and is older than one day
-    if os.path.exists(log_file):
-        if mtime(log_file) < one_day_ago:
-            new_log_file = f"{log_file}.{datetime.now().strftime('%Y-%m-%d')}.log.gz"
-            with open(log_file, 'rb') as f_in:
-                with gzip.open(new_log_file, 'wb') as f_out:
-                    f_out.writelines(f_in)
-            open(log_file, 'w').close()  # Clear the old log file
-    
-    # Check if error_log_file exists and is older than one day
-    if os.path.exists(error_log_file):
-        if mtime(error_log_file) < one_day_ago:
-            new_error_log_file = f"{error_log_file}.{datetime.now().strftime('%Y-%m-%d')}.log.gz"
-            with open(error_log_file, 'rb') as f_in:
-                with gzip.open(new_error_log_file, 'wb') as f_out:
-                    f_out.writelines(f_in)
-            open(error_log_file, 'w').close()  # Clear the old log file
-
-
-
-def move_gzipped_logs():
-    log_dir = config.get('log_dirs', '')
-    if not log_dir[0]:
-        logging.error("No log directories specified.")
-        return
-    if not os.path.exists(log_dir[0]):
-        logging.error(f"Log directory {log_dir[0]} does not exist.")
-        return
-    
-    # Move .log.gz files to the log directory
-    for file in os.listdir('.'):
-        if file.endswith('.log.gz'):
+def get_pair_options(src_dir):
+    """Return the settings for one pair: the global config overridden by its pair_options entry."""
+    options = dict(config)
+    options.update(config.get('pair_options', {}).get(src_dir, {}))
+    return options
+
+def uses_store(options):
+    """True when the pair is written through a store instead of as a plain mirror."""
+    return (options.get('snapshot_mode') == "Y" or options.get('dedup_mode') == "Y"
+            or options.get('compression') in COMPRESSION_SUFFIXES or options.get('pack_mode') == "Y")
+
+def plan_pair(src_dir, dest_dir, include_unchanged=False):
+    """Dry run of one pair: its change plan as a dict, without copying or recording anything."""
+    options = get_pair_options(src_dir)
+    manifest_path = manifest_path_for(src_dir, dest_dir, options.get('manifest_dir', MANIFEST_DIR))
+    manifest = BackupManifest(manifest_path) if os.path.exists(manifest_path) else None
+    try:
+        plan = plan_backup(src_dir, dest_dir, manifest, None, uses_store(options), keep_unchanged=include_unchanged)
+        return plan.to_dict(*pair_rates(manifest), include_unchanged)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+def record_idle_run(src_dir, dest_dir, plan):
+    """Count and report a run whose plan found nothing to do without executing it; return its BackupStats."""
+    stats = BackupStats(src_dir, dest_dir)
+    pair_key = f"{src_dir} -> {dest_dir}"
+    metrics.start_run(pair_key, stats, plan.full_scan)
+    stats.add('files_scanned', plan.file_count)
+    stats.add('files_unchanged', plan.file_count)
+    metrics.end_run(pair_key, stats, plan.full_scan)
+    logging.info(f"Backup summary: {stats.summary()}", extra={'pair': pair_key})
+    return stats
+
+def backup_pair(src_dir, dest_dir, rel_paths=None):
+    """Back up one configured source/dest pair using its manifest.
+
+    In snapshot mode rel_paths from watch mode only trigger the cycle: the whole
+    tree is planned first, and only when a file is new, modified or deleted is a
+    complete snapshot linked, so idle cycles neither touch the destination nor
+    use up snapshot_keep. In dedup mode
+    files are stored as chunk recipes, with a compression method they are stored
+    compressed, and in pack mode small files are appended to pack segments,
+    instead of plain copies.
+    """
+    with profiler.thread(), profiler.phase('pair', pair=f"{src_dir} -> {dest_dir}"):
+        return _backup_pair(src_dir, dest_dir, rel_paths)
+
+def _backup_pair(src_dir, dest_dir, rel_paths):
+    options = get_pair_options(src_dir)
+    workers = options.get('workers', 1)
+    manifest_dir = options.get('manifest_dir', MANIFEST_DIR)
+    with BackupManifest(manifest_path_for(src_dir, dest_dir, manifest_dir)) as manifest:
+        if options.get('snapshot_mode') == "Y":
+            store = SnapshotStore(dest_dir, options.get('snapshot_keep', SNAPSHOT_KEEP))
+            with profiler.phase('plan'):
+                plan = plan_backup(src_dir, store.prepare(), manifest, None, True, profiler.walk, keep_unchanged=True)
+            if not plan.change_count and store.snapshots():
+                return record_idle_run(src_dir, dest_dir, plan)
+            store.begin()
             try:
-                shutil.move(file, os.path.join(log_dir[0], file))
+                stats = backup_files(src_dir, dest_dir, manifest, workers, None, options, store, plan)
+            except Exception:
+                store.abort()
+                raise
+            if stats.get('files_copied') or stats.get('files_deleted') or not store.snapshots():
+                store.commit()
+            else:
+                store.discard()
+            return stats
+
+        if options.get('dedup_mode') == "Y":
+            stats = backup_files(src_dir, dest_dir, manifest, workers, rel_paths, options, DedupStore(dest_dir))
+            if stats.get('bytes_copied'):
+                logging.info(f"Dedup ratio: {src_dir} -> {dest_dir} | {dedup_ratio(stats):.2f}x")
+            return stats
+
+        if options.get('compression') in COMPRESSION_SUFFIXES:
+            with CompressedStore(dest_dir, options['compression'], options.get('compression_level'),
+                                 options.get('compression_processes')) as store:
+                return backup_files(src_dir, dest_dir, manifest, workers, rel_paths, options, store)
+
+        if options.get('pack_mode') == "Y":
+            with PackStore(dest_dir, options.get('pack_threshold', PACK_THRESHOLD),
+                           options.get('pack_segment_size', SEGMENT_SIZE)) as store:
+                return backup_files(src_dir, dest_dir, manifest, workers, rel_paths, options, store)
+
+        return backup_files(src_dir, dest_dir, manifest, workers, rel_paths, options)
+
+def run_watch_cycle(pairs, sleep_time):
+    """One pass of watch mode: full rescan when due, otherwise back up only changed paths.
+
+    Blocks in the watcher for up to sleep_time seconds instead of sleeping, so an
+    idle tree costs no walking at all. Pairs added by a config reload get one full
+    backup of their own. Returns False when inotify cannot be used.
+    """
+    global _watcher, _last_full_scan
+    src_dirs = list(dict.fromkeys(src_dir for src_dir, _dest_dir in pairs))
+    if _watcher is not None and set(_watcher.src_dirs) != set(src_dirs):
+        # Config reload: adjust the watches instead of rescanning every pair
+        for src_dir in list(_watcher.src_dirs):
+            if src_dir not in src_dirs:
+                _watcher.remove_source(src_dir)
+        for src_dir in src_dirs:
+            _watcher.add_source(src_dir)
+    if _watcher is None:
+        try:
+            _watcher = InotifyWatcher(src_dirs)
+        except OSError as e:
+            logging.error(f"Error starting inotify watcher, using polling: {e}")
+            _watcher = None
+            return False
+        _last_full_scan = None
+
+    rescan_interval = config.get('full_rescan_interval', FULL_RESCAN_INTERVAL)
+    if (_watcher.needs_full_rescan or _last_full_scan is None
+            or time.monotonic() - _last_full_scan >= rescan_interval):
+        _watcher.needs_full_rescan = False
+        _last_full_scan = time.monotonic()
+        _new_pairs.clear()
+        run_pairs(pairs, backup_pair)
+        return True
+
+    new_pairs = [pair for pair in _new_pairs if pair in pairs]
+    _new_pairs.clear()
+    if new_pairs:
+        run_pairs(new_pairs, backup_pair)
+        return True
+
+    with profiler.phase('watch_wait'):
+        changes = _watcher.collect(sleep_time)
+    changed_pairs = [(src_dir, dest_dir) for src_dir, dest_dir in pairs if changes.get(src_dir)]
+    if changed_pairs:
+        run_pairs(changed_pairs, lambda src_dir, dest_dir: backup_pair(src_dir, dest_dir, changes[src_dir]))
+    return True
+
+def get_rotator():
+    """Return the long-lived LogRotator, updated with the current retention settings."""
+    global _rotator
+    if _rotator is None:
+        _rotator = LogRotator()
+    _rotator.log_dir = first_log_dir(config.get('log_dirs', ''))
+    _rotator.retention_days = config.get('log_retention_days', LOG_RETENTION_DAYS)
+    _rotator.retention_bytes = config.get('log_retention_bytes', LOG_RETENTION_BYTES)
+    return _rotator
+
+def make_log_handler(log_file):
+    """Rotating batch handler for the main log plus the searchable log store.
+
+    Also compresses segments a crash left behind.
+    """
+    rotator = get_rotator()
+    rotator.recover(log_file)
+    rotator.recover(ERROR_LOG_FILE)
+    return [RotatingBatchFileHandler(log_file, rotator, config.get('log_max_bytes', LOG_MAX_BYTES),
+                                     config.get('log_rotate_interval', LOG_ROTATE_INTERVAL), encoding='utf-8'),
+            LogStoreHandler(config.get('log_store_file', LOG_STORE_FILE))]
+
+
+def scrub_pair(src_dir, dest_dir, sample_size):
+    """Re-hash a random sample of mirrored files and forget any that no longer match the manifest.
+
+    Only files whose destination stat still matches the manifest are checked, so
+    a mismatch means the copy changed underneath us; dropping its entry makes the
+    next cycle compare and re-copy it. Each removal is committed at once, so no
+    write transaction stays open on the manifest while files are hashed. Returns
+    the number of corrupt files found.
+    """
+    options = get_pair_options(src_dir)
+    if uses_store(options):
+        return 0  # stores keep their own layout; only plain mirrors are scrubbed
+    corrupt = 0
+    with BackupManifest(manifest_path_for(src_dir, dest_dir, options.get('manifest_dir', MANIFEST_DIR))) as manifest:
+        for rel_path, checksum, dest_size, dest_mtime_ns in manifest.sample(sample_size):
+            dest_file = os.path.join(dest_dir, rel_path)
+            try:
+                dest_stat = os.stat(dest_file)
+                if (dest_stat.st_size, dest_stat.st_mtime_ns) != (dest_size, dest_mtime_ns):
+                    continue  # changed since it was recorded; the next cycle handles it
+                if calculate_checksum(dest_file) != checksum:
+                    corrupt += 1
+                    manifest.remove(rel_path)
+                    manifest.commit()
+                    log_backup_error(f"Scrub checksum mismatch: {dest_file} | Expected: {checksum}",
+                                     f"{src_dir} -> {dest_dir}", dest_file)
+            except FileNotFoundError:
+                continue
             except Exception as e:
-                logging.error(f"Failed to move {file}: {e}")
+                log_backup_error(f"Scrub failed for {dest_file} | Error: {e}", f"{src_dir} -> {dest_dir}", dest_file)
+    return corrupt
 
+def load_config():
+    """Apply backup_config.json to the global config if the file changed since the last call.
 
-if __name__ == "__main__":
-    while True:
-        # print(os.getcwd())
+    Pairs added by the change are remembered in _new_pairs so watch mode can give
+    them their first full backup without rescanning the other pairs.
+    """
+    global config, ERROR_LOG_FILE, _profile_capture
+    changes = _config_manager.reload_if_changed()
+    if changes is None:
+        return config
+    added, removed = changes
+    if config and (added or removed):
+        logging.info(f"Configuration reloaded | Added pairs: {added} | Removed pairs: {removed}")
+    previous_profiling = config.get('profiling')
+    config = _config_manager.config
+    if config.get('profiling') != previous_profiling and config.get('profiling') in (PROFILE_CPROFILE, PROFILE_TRACE):
+        _profile_capture = config['profiling']  # capture one cycle each time the setting is switched on
+    ERROR_LOG_FILE = config['error_log_file']
+    _new_pairs.extend(pair for pair in added if pair not in _new_pairs)
+    for pair in removed:
+        if pair in _new_pairs:
+            _new_pairs.remove(pair)
+    return config
+
+def start_profiler():
+    """Return the profiler for the next cycle: an armed one-cycle capture, else the profiling setting.
+
+    cprofile and trace write their file for a single cycle; later cycles only
+    collect phase timings until the setting is switched on again.
+    """
+    global _profile_capture
+    mode = config.get('profiling', PROFILE_OFF)
+    if _profile_capture is not None:
+        mode, _profile_capture = _profile_capture, None
+    elif mode in (PROFILE_CPROFILE, PROFILE_TRACE):
+        mode = PROFILE_PHASES
+    if mode not in (PROFILE_PHASES, PROFILE_CPROFILE, PROFILE_TRACE):
+        return NULL_PROFILER
+    return CycleProfiler(mode)
+
+def report_profile(cycle_profiler):
+    """Log the phase summary of a profiled cycle and write its capture file, if any."""
+    global _profile_capture
+    if not cycle_profiler.enabled:
+        return
+    if not {'walk', 'plan'} & cycle_profiler.phase_seconds().keys():
+        # No pair was walked or planned (an idle watch-mode wait): keep any capture for a cycle that does work
+        if cycle_profiler.mode in (PROFILE_CPROFILE, PROFILE_TRACE) and _profile_capture is None:
+            _profile_capture = cycle_profiler.mode
+        return
+    logging.info(f"Cycle profile | {cycle_profiler.summary()}")
+    path = cycle_profiler.write(config.get('profile_dir', PROFILE_DIR))
+    if path:
+        logging.info(f"Wrote {cycle_profiler.mode} profile of the cycle to {path}")
+
+def run_backup_cycle():
+    """Scheduled job: reload the configuration and back up every pair once."""
+    global _watch_active, profiler
+    try:
+        load_config()
+
+        # Configuration
+        SOURCE_DIRS = config['source_dirs']
+        DEST_DIRS = config['dest_dirs']
+        LOG_FILE = config['log_file']
+        SLEEP_TIME = config['sleep_time']
+        RUN_ENABLED = config['run_enabled']  # Y = will run, anything else no run
+
+        profiler = start_profiler()
         try:
-            # Load configuration from file
-            with open('backup_config.json', 'r') as config_file:
-                config = json.load(config_file)
-
-            # Configuration
-            SOURCE_DIRS = config['source_dirs']
-            DEST_DIRS = config['dest_dirs']
-            LOG_FILE = config['log_file']
-            ERROR_LOG_FILE = config['error_log_file']
-            SLEEP_TIME = config['sleep_time']
-            RUN_ENABLED = config['run_enabled']  # Y = will run, anything else no run
-
-            # Logging configuration
-            logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format='%(asctime)s %(message)s')
-            
-            ## Threads =================================================
-
-            # Start auto-refresh thread
-            rotate_logs_auto_thread = Thread(target=rotate_logs, daemon=True)
-            rotate_logs_auto_thread.start()
-            Gzip_logs_auto_thread = Thread(target=move_gzipped_logs, daemon=True)
-            Gzip_logs_auto_thread.start()
-
-            if RUN_ENABLED == "Y":
-                for src_dir, dest_dir in zip(SOURCE_DIRS, DEST_DIRS):
-                    backup_files(src_dir, dest_dir)
-            else:
-                logging.info(f"Run Disabled, Exiting Process: {__name__}")
+            with profiler.thread():
+                # Logging configuration
+                with profiler.phase('setup_logging'):
+                    setup_logging(LOG_FILE, make_handler=make_log_handler)
+
+                if RUN_ENABLED == "Y":
+                    pairs = list(zip(SOURCE_DIRS, DEST_DIRS))
+                    _watch_active = (config.get('watch_mode') == "Y" and inotify_available()
+                                     and run_watch_cycle(pairs, SLEEP_TIME))
+                    if not _watch_active:
+                        _new_pairs.clear()  # a polling pass covers new pairs anyway
+                        run_pairs(pairs, backup_pair)
+                else:
+                    _watch_active = False
+                    logging.info(f"Run Disabled, Exiting Process: {__name__}")
+        finally:
+            cycle_profiler, profiler = profiler, NULL_PROFILER
+            report_profile(cycle_profiler)
+
+    except json.JSONDecodeError as e:
+        logging.error(f"Error loading configuration: {e}")
+    except ConfigError as e:
+        logging.error(f"Invalid configuration: {e}")
+    except FileNotFoundError as e:
+        logging.error(f"Configuration file not found: {e}")
+
+def backup_interval():
+    """Watch mode waits inside the watcher, so the next cycle starts right away."""
+    return 0 if _watch_active else config.get('sleep_time', 5)
+
+def run_rotation():
+    """Scheduled job: rotate the error log when due and apply retention to both logs."""
+    rotator = get_rotator()
+    with _error_log_lock:
+        rotator.rotate_if_due(ERROR_LOG_FILE, config.get('log_max_bytes', LOG_MAX_BYTES),
+                              config.get('log_rotate_interval', LOG_ROTATE_INTERVAL))
+    for log_file in (config.get('log_file'), ERROR_LOG_FILE):
+        if log_file:
+            rotator.apply_retention(log_file)
+    with LogStore(config.get('log_store_file', LOG_STORE_FILE)) as log_store:
+        log_store.prune(config.get('log_retention_days', LOG_RETENTION_DAYS))
+
+def run_log_shipping():
+    """Scheduled job: move rotated logs left beside the live logs into the log directory.
+
+    Rotated main logs from before the log store existed are imported into it once.
+    """
+    rotator = get_rotator()
+    for log_file in (config.get('log_file'), ERROR_LOG_FILE):
+        if log_file and rotator.ship(log_file):
+            logging.info(f"Moved rotated logs of {log_file} to {rotator.log_dir}")
+    if config.get('log_file'):
+        with LogStore(config.get('log_store_file', LOG_STORE_FILE)) as log_store:
+            imported = log_store.import_rotated(config['log_file'], rotator.log_dir)
+        if imported:
+            logging.info(f"Imported {imported} records from rotated logs into the log store")
+
+def run_scrub():
+    """Scheduled job: verify a sample of every pair's backed-up files."""
+    if config.get('run_enabled') != "Y":
+        return
+    sample_size = config.get('scrub_sample', SCRUB_SAMPLE)
+    for src_dir, dest_dir in zip(config.get('source_dirs', []), config.get('dest_dirs', [])):
+        if metrics.is_running(f"{src_dir} -> {dest_dir}"):
+            # Its backup holds a write transaction on the manifest between commits
+            logging.info(f"Scrub: {src_dir} -> {dest_dir} | Skipped, backup in progress")
+            continue
+        corrupt = scrub_pair(src_dir, dest_dir, sample_size)
+        logging.info(f"Scrub: {src_dir} -> {dest_dir} | Checked: up to {sample_size} | Corrupt: {corrupt}")
+
+def build_scheduler():
+    """Register the daemon's recurring jobs; intervals are re-read from config after every run."""
+    scheduler = Scheduler()
+    scheduler.add_job('backup', run_backup_cycle, backup_interval)
+    scheduler.add_job('rotation', run_rotation, lambda: config.get('rotation_check_interval', ROTATION_CHECK_INTERVAL),
+                      jitter=0.1, delay=ROTATION_CHECK_INTERVAL)
+    scheduler.add_job('log_shipping', run_log_shipping, lambda: config.get('log_ship_interval', LOG_SHIP_INTERVAL),
+                      jitter=0.1, delay=ROTATION_CHECK_INTERVAL)
+    scheduler.add_job('scrub', run_scrub, lambda: config.get('scrub_interval', SCRUB_INTERVAL),
+                      jitter=0.1, delay=SCRUB_INTERVAL)
+    return scheduler
+
+
+def control_commands(scheduler):
+    """Commands answered by the control channel."""
+    def status():
+        return {'pid': os.getpid(), 'started': _started_at, 'run_enabled': config.get('run_enabled'),
+                'watch_mode': _watch_active, 'jobs': scheduler.status()}
 
-            time.sleep(SLEEP_TIME)
+    def progress():
+        return metrics.progress()
 
-        except json.JSONDecodeError as e:
-            logging.error(f"Error loading configuration: {e}")
-        except FileNotFoundError as e:
-            logging.error(f"Configuration file not found: {e}")
-        except Exception as e:
-            logging.error(f"Unexpected error: {e}")
+    def trigger():
+        scheduler.trigger('backup')
+        return True
+
+    def profile():
+        """Capture the next cycle that backs up files, in the configured mode or else as a trace."""
+        global _profile_capture
+        mode = config.get('profiling')
+        _profile_capture = mode if mode in (PROFILE_CPROFILE, PROFILE_TRACE) else PROFILE_TRACE
+        scheduler.trigger('backup')
+        return _profile_capture
+
+    def stop():
+        logging.info("Stop requested through the control channel")
+        scheduler.stop()
+        return True
+
+    return {'status': status, 'progress': progress, 'trigger': trigger, 'profile': profile, 'stop': stop}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up the configured source/destination pairs.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print the change plan of every pair as JSON and exit without copying")
+    parser.add_argument('--all-files', action='store_true', help="list unchanged files in the plan as well")
+    args = parser.parse_args()
+    if args.dry_run:
+        try:
+            load_config()
+        except (ConfigError, OSError, json.JSONDecodeError) as e:
+            print(f"Error loading configuration: {e}", file=sys.stderr)
+            sys.exit(1)
+        plans = [plan_pair(src_dir, dest_dir, args.all_files)
+                 for src_dir, dest_dir in zip(config['source_dirs'], config['dest_dirs'])]
+        print(json.dumps(plans, indent=2))
+        sys.exit(0 if all(plan['fits'] for plan in plans) else 2)
+
+    try:
+        daemon_lock = DaemonLock(PID_FILE).acquire()
+    except DaemonAlreadyRunning as e:
+        logging.error(f"{e}; exiting")
+        sys.exit(1)
+    scheduler = build_scheduler()
+    control = ControlServer(control_commands(scheduler), CONTROL_ADDRESS_FILE).start()
+    try:
+        load_config()
+    except Exception as e:
+        logging.error(f"Error loading configuration: {e}")  # the backup job keeps retrying
+    metrics_port = config.get('metrics_port', METRICS_PORT)
+    metrics_server = MetricsServer(metrics, metrics_port).start() if metrics_port else None
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    finally:
+        scheduler.join()  # let a backup in progress finish and commit its manifest
+        shutdown_compression_pools()
+        control.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        daemon_lock.release()
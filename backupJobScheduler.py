@@ -0,0 +1,139 @@
+import logging
+import random
+import threading
+import time
+
+MAX_BACKOFF = 3600  # longest delay after repeated failures of a job
+
+class Job:
+    """A recurring job; interval may be a number of seconds or a callable returning one."""
+
+    def __init__(self, name, func, interval, jitter=0.0, max_backoff=MAX_BACKOFF, delay=0.0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.next_run = time.monotonic() + delay
+        self.failures = 0
+        self.running = False
+        self.triggered = False
+        self.last_duration = None
+        self.thread = None
+
+    def current_interval(self):
+        return self.interval() if callable(self.interval) else self.interval
+
+    def schedule_next(self, failed):
+        """Set next_run from the end of the run that just finished."""
+        interval = self.current_interval()
+        if failed:
+            self.failures += 1
+            delay = min(max(interval, 1) * 2 ** self.failures, self.max_backoff)
+        else:
+            self.failures = 0
+            delay = interval
+        if self.jitter and delay:
+            delay += random.uniform(0, self.jitter * delay)
+        self.next_run = time.monotonic() + delay
+
+class Scheduler:
+    """Runs recurring jobs, each on its own long-lived thread.
+
+    A job's thread sleeps on a condition until the job is due, runs it and
+    computes the next run from when it finished, so a job can never overlap
+    itself and an idle scheduler uses no CPU. Failed runs back off
+    exponentially up to max_backoff; jitter spreads runs by up to that
+    fraction of the interval.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._started = False
+
+    def add_job(self, name, func, interval, jitter=0.0, max_backoff=MAX_BACKOFF, delay=0.0):
+        job = Job(name, func, interval, jitter, max_backoff, delay)
+        with self._cond:
+            self._jobs[name] = job
+            if self._started:
+                self._start_job(job)
+        return job
+
+    def start(self):
+        with self._cond:
+            self._started = True
+            for job in self._jobs.values():
+                self._start_job(job)
+
+    def _start_job(self, job):
+        job.thread = threading.Thread(target=self._run_job, args=(job,), name=f"Job-{job.name}", daemon=True)
+        job.thread.start()
+
+    def _run_job(self, job):
+        while True:
+            with self._cond:
+                while not self._stopping and not job.triggered and job.next_run > time.monotonic():
+                    self._cond.wait(job.next_run - time.monotonic())
+                if self._stopping:
+                    return
+                job.triggered = False
+                job.running = True
+
+            started = time.monotonic()
+            failed = False
+            try:
+                job.func()
+            except Exception as e:
+                failed = True
+                logging.error(f"Scheduled job {job.name} failed: {e}")
+
+            with self._cond:
+                job.running = False
+                job.last_duration = time.monotonic() - started
+                job.schedule_next(failed)
+                self._cond.notify_all()
+
+    def trigger(self, name):
+        """Run a job now, or right after its current run finishes."""
+        with self._cond:
+            self._jobs[name].triggered = True
+            self._cond.notify_all()
+
+    def next_run_times(self):
+        """Return {job name: wall-clock time of its next run}; None while the job is running."""
+        offset = time.time() - time.monotonic()
+        with self._cond:
+            return {name: None if job.running else job.next_run + offset for name, job in self._jobs.items()}
+
+    def status(self):
+        """Return {job name: {next_run, running, last_duration, failures}} with wall-clock next runs."""
+        next_runs = self.next_run_times()
+        with self._cond:
+            return {name: {'next_run': next_runs[name], 'running': job.running,
+                           'last_duration': job.last_duration, 'failures': job.failures}
+                    for name, job in self._jobs.items()}
+
+    def is_running(self, name):
+        with self._cond:
+            return self._jobs[name].running
+
+    def stop(self):
+        """Stop scheduling new runs; a run in progress is left to finish."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait for the job threads to finish their current runs after stop()."""
+        for job in list(self._jobs.values()):
+            if job.thread is not None:
+                job.thread.join(timeout)
+
+    def run_forever(self):
+        """Start the jobs and block the calling thread until stop() is called."""
+        self.start()
+        with self._cond:
+            while not self._stopping:
+                self._cond.wait()
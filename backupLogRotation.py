@@ -0,0 +1,195 @@
+import glob
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from backupLogging import BatchFileHandler
+
+LOG_MAX_BYTES = 10 * 1024 * 1024  # rotate the live log once it reaches this size
+LOG_ROTATE_INTERVAL = 86400  # ...or once it has been written to for this many seconds
+LOG_RETENTION_DAYS = 30  # delete rotated logs older than this
+LOG_RETENTION_BYTES = 500 * 1024 * 1024  # and keep the rotated logs of one file below this total
+ROTATED_SUFFIX = '.log.gz'
+
+def first_log_dir(log_dirs):
+    """log_dirs is a list in backup_config.json but the GUI may save a ';'-separated string."""
+    if isinstance(log_dirs, str):
+        log_dirs = log_dirs.split(';')
+    return next((log_dir for log_dir in log_dirs or [] if log_dir), '')
+
+class LogRotator:
+    """Rotates log files by rename and compresses the rotated segments in one background worker.
+
+    rotate() renames the live file to <name>.<timestamp> (no copy) and queues it;
+    the worker gzips it straight into log_dir as <name>.<timestamp>.log.gz, removes
+    the uncompressed segment and then applies the age and size retention limits.
+    """
+
+    def __init__(self, log_dir='', retention_days=LOG_RETENTION_DAYS, retention_bytes=LOG_RETENTION_BYTES):
+        self.log_dir = log_dir
+        self.retention_days = retention_days
+        self.retention_bytes = retention_bytes
+        self._queue = queue.Queue()
+        self._first_seen = {}
+        self._worker = threading.Thread(target=self._run, name='LogCompressor', daemon=True)
+        self._worker.start()
+
+    def target_dir(self, log_file):
+        if self.log_dir and os.path.isdir(self.log_dir):
+            return self.log_dir
+        if self.log_dir:
+            logging.error(f"Log directory {self.log_dir} does not exist; keeping rotated logs beside {log_file}")
+        return os.path.dirname(os.path.abspath(log_file))
+
+    def rotate(self, log_file):
+        """Rename log_file aside and queue it for compression; return the rotated path."""
+        rotated = f"{log_file}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+        counter = 1
+        while os.path.exists(rotated):
+            rotated = f"{log_file}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{counter}"
+            counter += 1
+        os.replace(log_file, rotated)
+        self._queue.put((log_file, rotated))
+        return rotated
+
+    def rotate_if_due(self, log_file, max_bytes=LOG_MAX_BYTES, interval=LOG_ROTATE_INTERVAL):
+        """Rotate a file that nobody holds open (e.g. the error log) once it is too big or too old."""
+        try:
+            st = os.stat(log_file)
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+        if st.st_size >= max_bytes or time.time() - self._created_at(log_file, st) >= interval:
+            return self.rotate(log_file)
+        return None
+
+    def _created_at(self, log_file, st):
+        """Creation time where the OS records it, otherwise when this process first saw the file."""
+        if os.name == 'nt':
+            return st.st_ctime
+        if hasattr(st, 'st_birthtime'):
+            return st.st_birthtime
+        return self._first_seen.setdefault((log_file, st.st_ino), time.time())
+
+    def recover(self, log_file):
+        """Queue segments left uncompressed by a previous run (e.g. after a crash)."""
+        for rotated in glob.glob(glob.escape(log_file) + '.*'):
+            if not rotated.endswith(('.gz', '.tmp')):
+                self._queue.put((log_file, rotated))
+
+    def _run(self):
+        while True:
+            log_file, rotated = self._queue.get()
+            try:
+                self._compress(log_file, rotated)
+                self.apply_retention(log_file)
+            except Exception as e:
+                logging.error(f"Failed to compress rotated log {rotated}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _compress(self, log_file, rotated):
+        base = os.path.join(self.target_dir(log_file), os.path.basename(rotated))
+        target = base + ROTATED_SUFFIX
+        counter = 1
+        while os.path.exists(target):  # several rotations within one second
+            target = f"{base}_{counter}{ROTATED_SUFFIX}"
+            counter += 1
+        temp = target + '.tmp'
+        with open(rotated, 'rb') as f_in, gzip.open(temp, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(temp, target)
+        os.remove(rotated)
+
+    def apply_retention(self, log_file):
+        """Delete the oldest rotated logs of log_file beyond the age and total size limits."""
+        pattern = os.path.join(glob.escape(self.target_dir(log_file)),
+                               glob.escape(os.path.basename(log_file)) + '.*' + ROTATED_SUFFIX)
+        rotated = []
+        for path in glob.glob(pattern):
+            try:
+                st = os.stat(path)
+                rotated.append((st.st_mtime, st.st_size, path))
+            except FileNotFoundError:
+                continue
+        rotated.sort(reverse=True)  # newest first
+        cutoff = time.time() - self.retention_days * 86400 if self.retention_days else None
+        total = 0
+        for mtime, size, path in rotated:
+            total += size
+            too_old = cutoff is not None and mtime < cutoff
+            too_big = self.retention_bytes and total > self.retention_bytes
+            if too_old or too_big:
+                try:
+                    os.remove(path)
+                    logging.info(f"Removed rotated log: {path}")
+                except OSError as e:
+                    logging.error(f"Failed to remove rotated log {path}: {e}")
+
+    def ship(self, log_file):
+        """Move rotated logs kept beside log_file (log_dir was missing) into log_dir; return the count."""
+        log_dir = self.target_dir(log_file)
+        local_dir = os.path.dirname(os.path.abspath(log_file))
+        if os.path.abspath(log_dir) == local_dir:
+            return 0
+        shipped = 0
+        pattern = os.path.join(glob.escape(local_dir), glob.escape(os.path.basename(log_file)) + '.*' + ROTATED_SUFFIX)
+        for path in glob.glob(pattern):
+            try:
+                shutil.move(path, os.path.join(log_dir, os.path.basename(path)))
+                shipped += 1
+            except OSError as e:
+                logging.error(f"Failed to move rotated log {path} to {log_dir}: {e}")
+        if shipped:
+            self.apply_retention(log_file)
+        return shipped
+
+    def wait(self):
+        """Block until every queued segment has been compressed."""
+        self._queue.join()
+
+class RotatingBatchFileHandler(BatchFileHandler):
+    """BatchFileHandler that rotates its file by rename between batches.
+
+    Rotation runs on the log writer thread while the handler lock is held, so a
+    batch is always written either entirely before or entirely after the rename
+    and no record is lost. Rotation happens on size or on age.
+    """
+
+    def __init__(self, log_file, rotator, max_bytes=LOG_MAX_BYTES, interval=LOG_ROTATE_INTERVAL, **kwargs):
+        super().__init__(log_file, **kwargs)
+        self.rotator = rotator
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def emit_batch(self, records):
+        with self.lock:
+            if self._should_rotate():
+                self._rotate()
+        super().emit_batch(records)
+
+    def _should_rotate(self):
+        if self.stream is None:
+            return False
+        size = self.stream.tell()
+        if size == 0:
+            return False
+        return size >= self.max_bytes or time.time() >= self.rollover_at
+
+    def _rotate(self):
+        self.stream.close()
+        self.stream = None
+        try:
+            self.rotator.rotate(self.baseFilename)
+        except OSError as e:
+            logging.lastResort.handle(logging.makeLogRecord({'msg': f"Failed to rotate {self.baseFilename}: {e}",
+                                                             'levelno': logging.ERROR, 'levelname': 'ERROR'}))
+        self.stream = self._open()
+        self.rollover_at = time.time() + self.interval
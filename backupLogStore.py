@@ -0,0 +1,218 @@
+import glob
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from backupLogRotation import ROTATED_SUFFIX
+
+LOG_STORE_FILE = 'backupLogs.sqlite'
+PAGE_SIZE = 100
+TEXT_LINE = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,(\d{3}))? (.*)$')
+TEXT_PAIR = re.compile(r'^(?:Backup summary|Pair cycle time|Dedup ratio|Scrub): (.+? -> .+?) \|')
+TEXT_PATH = re.compile(r'^(?:Backed up file(?: \(delta\))?|Failed to back up file|File unchanged, skipping backup'
+                       r'|Scrub checksum mismatch): (.+?)(?: -> | \||$)')
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS records ("
+    "id INTEGER PRIMARY KEY, ts REAL NOT NULL, level TEXT, pair TEXT, path TEXT, message TEXT)",
+    "CREATE INDEX IF NOT EXISTS records_ts ON records(ts, id)",
+    "CREATE INDEX IF NOT EXISTS records_level_ts ON records(level, ts, id)",
+    "CREATE INDEX IF NOT EXISTS records_pair_ts ON records(pair, ts, id)",
+    "CREATE INDEX IF NOT EXISTS records_path ON records(path)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5("
+    "message, path, content='records', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS records_ai AFTER INSERT ON records BEGIN "
+    "INSERT INTO records_fts(rowid, message, path) VALUES (new.id, new.message, new.path); END",
+    "CREATE TRIGGER IF NOT EXISTS records_ad AFTER DELETE ON records BEGIN "
+    "INSERT INTO records_fts(records_fts, rowid, message, path) VALUES ('delete', old.id, old.message, old.path); END",
+    "CREATE TABLE IF NOT EXISTS imported (file TEXT PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)",
+)
+
+def fts_query(text):
+    """Quote every word so user input is matched literally instead of as FTS syntax."""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+class LogStore:
+    """Indexed SQLite store of log records, searchable by text, path, level, pair and time.
+
+    Records carry the pair and path the daemon attaches to its log calls; the
+    message and path are full-text indexed (FTS5) and results are paged with a
+    (ts, id) cursor, so a page costs the same however deep it is.
+    """
+
+    def __init__(self, db_path=LOG_STORE_FILE):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('created', ?)", (time.time(),))
+        self._conn.commit()
+        # Records from this time on are written live; text logs only fill in what came before
+        self.created = self._conn.execute("SELECT value FROM meta WHERE key = 'created'").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_many(self, rows):
+        """Insert (ts, level, pair, path, message) rows in one transaction."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO records (ts, level, pair, path, message) VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def query(self, text=None, path=None, level=None, pair=None, since=None, until=None,
+              limit=PAGE_SIZE, before=None):
+        """Return up to limit records, newest first, as (id, ts, level, pair, path, message) rows.
+
+        path matches as a prefix; since/until are epoch seconds. Pass the (ts, id)
+        of the last row of a page as before to get the next page.
+        """
+        clauses = []
+        params = []
+        if text:
+            clauses.append("id IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)")
+            params.append(fts_query(text))
+        if path:
+            clauses.append("path >= ? AND path < ?")
+            params += [path, path + '\U0010ffff']
+        if level:
+            clauses.append("level = ?")
+            params.append(level)
+        if pair:
+            clauses.append("pair = ?")
+            params.append(pair)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if before is not None:
+            clauses.append("(ts < ? OR (ts = ? AND id < ?))")
+            params += [before[0], before[0], before[1]]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT id, ts, level, pair, path, message FROM records {where} "
+                f"ORDER BY ts DESC, id DESC LIMIT ?", params + [limit]).fetchall()
+
+    def pairs(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT pair FROM records WHERE pair IS NOT NULL ORDER BY pair")]
+
+    def prune(self, retention_days):
+        """Delete records older than retention_days; return how many were removed.
+
+        0 or None keeps every record, as it keeps every rotated log in LogRotator.apply_retention.
+        """
+        if not retention_days:
+            return 0
+        cutoff = time.time() - retention_days * 86400
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM records WHERE ts < ?", (cutoff,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def import_text_log(self, log_path, level=None, before=None):
+        """Load a plain or gzipped text log; return the number of records added.
+
+        The text format has no level, so lines are stored as level (or INFO, and
+        ERROR for failure messages) with pair and path parsed from known messages.
+        Lines at or after before are skipped.
+        """
+        opener = gzip.open if log_path.endswith('.gz') else open
+        rows = []
+        count = 0
+        with opener(log_path, 'rt', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                match = TEXT_LINE.match(line.rstrip('\n'))
+                if match is None:
+                    continue
+                stamp, millis, message = match.groups()
+                ts = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S').timestamp() + int(millis or 0) / 1000
+                if before is not None and ts >= before:
+                    continue
+                pair_match = TEXT_PAIR.match(message)
+                path_match = TEXT_PATH.match(message)
+                record_level = level or ('ERROR' if message.startswith(('Failed', 'Error', 'Scrub checksum')) else 'INFO')
+                rows.append((ts, record_level, pair_match.group(1) if pair_match else None,
+                             path_match.group(1) if path_match else None, message))
+                if len(rows) >= 10000:
+                    self.add_many(rows)
+                    count += len(rows)
+                    rows = []
+        self.add_many(rows)
+        return count + len(rows)
+
+    def import_rotated(self, log_file, log_dir):
+        """Import the history in rotated logs of log_file (from log_dir and beside log_file) once per file."""
+        imported = 0
+        base = glob.escape(os.path.basename(log_file)) + '.*' + ROTATED_SUFFIX
+        directories = {os.path.abspath(log_dir) if log_dir else None, os.path.dirname(os.path.abspath(log_file))}
+        for directory in filter(None, directories):
+            for path in sorted(glob.glob(os.path.join(glob.escape(directory), base))):
+                name = os.path.basename(path)
+                with self._lock:
+                    if self._conn.execute("SELECT 1 FROM imported WHERE file = ?", (name,)).fetchone():
+                        continue
+                try:
+                    imported += self.import_text_log(path, before=self.created)
+                except Exception as e:
+                    logging.error(f"Failed to import rotated log {path}: {e}")
+                    continue
+                with self._lock:
+                    self._conn.execute("INSERT OR IGNORE INTO imported VALUES (?)", (name,))
+                    self._conn.commit()
+        return imported
+
+class LogStoreHandler(logging.Handler):
+    """Logging handler that writes records into a LogStore, one transaction per batch.
+
+    The pair and path of a record come from extra={'pair': ..., 'path': ...}.
+    """
+
+    def __init__(self, db_path=LOG_STORE_FILE, level=logging.NOTSET):
+        super().__init__(level)
+        self.db_path = db_path
+        self.store = None
+
+    def _rows(self, records):
+        for record in records:
+            if record.levelno < self.level:
+                continue
+            yield (record.created, record.levelname, getattr(record, 'pair', None),
+                   getattr(record, 'path', None), record.getMessage())
+
+    def emit_batch(self, records):
+        if self.store is None:
+            self.store = LogStore(self.db_path)  # opened on the writer thread that uses it
+        self.store.add_many(list(self._rows(records)))
+
+    def emit(self, record):
+        try:
+            self.emit_batch([record])
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        super().close()
@@ -0,0 +1,66 @@
+import os
+
+TAIL_BYTES = 1024 * 1024  # most bytes read per poll; older backlog is skipped
+
+class LogTailer:
+    """Follows a growing log file, returning only the lines appended since the last poll.
+
+    The reader remembers the inode and byte offset it stopped at. A new inode
+    (the file was rotated by rename) or a file shorter than the offset
+    (truncated) restarts from the tail of the new file. Appended data beyond
+    tail_bytes is skipped, so each poll reads a bounded amount whatever the
+    file size. The file is opened per poll and never held open, so rotation
+    can rename it on Windows too.
+    """
+
+    def __init__(self, log_file, tail_bytes=TAIL_BYTES):
+        self.log_file = log_file
+        self.tail_bytes = tail_bytes
+        self._inode = None
+        self._offset = 0
+        self._partial = b''
+
+    def reset(self):
+        """Forget the position so the next poll starts again from the tail."""
+        self._inode = None
+        self._offset = 0
+        self._partial = b''
+
+    def read_new(self):
+        """Return (restarted, new complete lines), or None if the file does not exist.
+
+        restarted is True when the lines do not continue the previous ones (first
+        poll, rotation, truncation or skipped backlog), so the caller should clear
+        what it shows before adding them.
+        """
+        try:
+            f = open(self.log_file, 'rb')
+        except FileNotFoundError:
+            self.reset()
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            restarted = False
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._inode = st.st_ino
+                self._offset = 0
+                self._partial = b''
+                restarted = True
+            skip_partial_line = False
+            if st.st_size - self._offset > self.tail_bytes:
+                self._offset = st.st_size - self.tail_bytes
+                self._partial = b''
+                restarted = skip_partial_line = True
+            if st.st_size == self._offset:
+                return restarted, []
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+            self._offset += len(data)
+
+        data = self._partial + data
+        if skip_partial_line:
+            newline = data.find(b'\n')
+            data = data[newline + 1:] if newline >= 0 else b''
+        lines = data.split(b'\n')
+        self._partial = lines.pop()  # an incomplete last line waits for the next poll
+        return restarted, [line.rstrip(b'\r').decode('utf-8', 'replace') for line in lines]
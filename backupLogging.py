@@ -0,0 +1,136 @@
+import atexit
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler
+
+LOG_FORMAT = '%(asctime)s %(message)s'
+BATCH_SIZE = 1000  # records written per batch at most
+FLUSH_INTERVAL = 0.5  # seconds a partial batch may wait for more records
+
+# log_verbosity values
+VERBOSITY_FILES = 'files'  # one line per file, including unchanged files
+VERBOSITY_CHANGES = 'changes'  # copied files and errors; unchanged files only counted in the summary
+VERBOSITY_SUMMARY = 'summary'  # only per-run summaries and errors
+DEFAULT_VERBOSITY = VERBOSITY_CHANGES
+
+class BatchFileHandler(logging.FileHandler):
+    """FileHandler that writes a whole batch of records with one write and one flush."""
+
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            if record.levelno < self.level:
+                continue
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        with self.lock:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(''.join(lines))
+            self.stream.flush()
+
+class BatchingLogWriter(threading.Thread):
+    """Background thread that drains the log queue and hands records to handlers in batches."""
+
+    def __init__(self, log_queue, handlers, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        super().__init__(name='BatchingLogWriter', daemon=True)
+        self.log_queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stop_sentinel = object()
+
+    def run(self):
+        while True:
+            record = self.log_queue.get()
+            stopping = record is self._stop_sentinel
+            batch = [] if stopping else [record]
+            try:
+                while len(batch) < self.batch_size:
+                    record = self.log_queue.get(timeout=self.flush_interval) if not stopping else self.log_queue.get_nowait()
+                    if record is self._stop_sentinel:
+                        stopping = True
+                        continue
+                    batch.append(record)
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        for handler in self.handlers:
+            try:
+                if hasattr(handler, 'emit_batch'):
+                    handler.emit_batch(batch)
+                else:
+                    for record in batch:
+                        handler.handle(record)
+            except Exception:
+                logging.lastResort.handle(batch[-1])
+
+    def stop(self):
+        """Write everything still queued, then end the thread."""
+        self.log_queue.put(self._stop_sentinel)
+        self.join()
+        for handler in self.handlers:
+            handler.close()
+
+_writer = None
+_queue_handler = None
+_log_file = None
+_setup_lock = threading.Lock()
+
+def setup_logging(log_file, level=logging.INFO, make_handler=None):
+    """Route the root logger through a queue to a background batching writer.
+
+    Callers only pay for putting a record on the queue; the file is written by
+    the writer thread in batches. Calling it again with the same log_file is a
+    no-op, so the daemon can call it every cycle. make_handler(log_file) builds
+    the handler, or list of handlers, to use instead of the default
+    BatchFileHandler (e.g. a rotating one plus a LogStoreHandler).
+    """
+    global _writer, _queue_handler, _log_file
+    with _setup_lock:
+        if _writer is not None and _log_file == log_file:
+            return
+        _stop_writer()
+        if make_handler is None:
+            handlers = [BatchFileHandler(log_file, encoding='utf-8')]
+        else:
+            handlers = make_handler(log_file)
+            if isinstance(handlers, logging.Handler):
+                handlers = [handlers]
+        for handler in handlers:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        log_queue = queue.SimpleQueue()
+        _writer = BatchingLogWriter(log_queue, handlers)
+        _writer.start()
+        _queue_handler = QueueHandler(log_queue)
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        _log_file = log_file
+
+def _stop_writer():
+    global _writer, _queue_handler, _log_file
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+    _log_file = None
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    with _setup_lock:
+        _stop_writer()
+
+atexit.register(shutdown_logging)
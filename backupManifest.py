@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+MANIFEST_DIR = 'Manifests'
+COMMIT_EVERY = 500  # pending writes before the manifest is flushed to disk
+
+def manifest_path_for(src_dir, dest_dir, manifest_dir=MANIFEST_DIR):
+    """Return the manifest database path for a source/destination pair."""
+    pair_key = f"{os.path.abspath(src_dir)}|{os.path.abspath(dest_dir)}"
+    digest = hashlib.md5(pair_key.encode('utf-8')).hexdigest()
+    return os.path.join(manifest_dir, f"manifest_{digest}.sqlite")
+
+def stat_key(st):
+    """Return the (size, mtime_ns, inode) tuple used to detect changes without hashing."""
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+class BackupManifest:
+    """Persistent record of the last backed-up state of every file in one source/dest pair.
+
+    Each row holds the source size, mtime_ns, inode and checksum plus the size and
+    mtime_ns of the destination copy, so unchanged files are detected from two stat
+    calls instead of hashing both sides.
+    """
+
+    def __init__(self, db_path):
+        try:
+            db_dir = os.path.dirname(db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            self.db_path = db_path
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._lock = threading.RLock()  # backup workers share one connection
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                "checksum TEXT, dest_size INTEGER, dest_mtime_ns INTEGER)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS transfers ("
+                "path TEXT PRIMARY KEY, temp_file TEXT, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                "block_size INTEGER, block_checksums BLOB)"
+            )
+            self._pending = 0
+        except Exception as e:
+            logging.error(f"Error opening manifest {db_path}: {e}")
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, rel_path):
+        """Return (size, mtime_ns, inode, checksum, dest_size, dest_mtime_ns) or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size, mtime_ns, inode, checksum, dest_size, dest_mtime_ns FROM files WHERE path = ?",
+                (rel_path,),
+            ).fetchone()
+
+    def record(self, rel_path, src_stat, checksum, dest_stat):
+        """Store the state of a file that is now identical on both sides."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (rel_path, *stat_key(src_stat), checksum, dest_stat.st_size, dest_stat.st_mtime_ns),
+            )
+            self._mark_dirty()
+
+    def remove(self, rel_path):
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (rel_path,))
+            self._mark_dirty()
+
+    def remove_tree(self, rel_path):
+        """Drop the entry for rel_path and, if it was a directory, everything under it."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                (rel_path, len(rel_path) + 1, rel_path + os.sep),
+            )
+            self._mark_dirty()
+
+    def paths(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM files")]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def sample(self, count):
+        """Return up to count random (path, checksum, dest_size, dest_mtime_ns) rows."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, checksum, dest_size, dest_mtime_ns FROM files ORDER BY RANDOM() LIMIT ?",
+                (count,),
+            ).fetchall()
+
+    def get_meta(self, key, default=None):
+        """Return a per-pair value such as the measured copy rate, or default."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+            self._mark_dirty()
+
+    def get_transfer(self, rel_path):
+        """Return (temp_file, size, mtime_ns, inode, block_size, block_checksums) of a journaled copy, or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT temp_file, size, mtime_ns, inode, block_size, block_checksums FROM transfers WHERE path = ?",
+                (rel_path,),
+            ).fetchone()
+
+    def save_transfer(self, rel_path, temp_file, src_stat, block_size, block_checksums):
+        """Journal the progress of a copy and commit at once, so it survives the process being killed."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (rel_path, temp_file, *stat_key(src_stat), block_size, block_checksums),
+            )
+            self.commit()
+
+    def remove_transfer(self, rel_path):
+        with self._lock:
+            self._conn.execute("DELETE FROM transfers WHERE path = ?", (rel_path,))
+            self.commit()
+
+    def transfers(self):
+        """Return (rel_path, temp_file) of every journaled in-flight copy."""
+        with self._lock:
+            return self._conn.execute("SELECT path, temp_file FROM transfers").fetchall()
+
+    def prune(self, seen_paths):
+        """Drop entries for files that no longer exist in the source tree."""
+        stale = [path for path in self.paths() if path not in seen_paths]
+        for path in stale:
+            self.remove(path)
+        return stale
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        try:
+            self.commit()
+            self._conn.close()
+        except Exception as e:
+            logging.error(f"Error closing manifest {self.db_path}: {e}")
+
+    def _mark_dirty(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+
+def is_unchanged(entry, src_stat, dest_stat):
+    """True when neither side has been touched since the entry was recorded."""
+    if entry is None:
+        return False
+    size, mtime_ns, inode, _checksum, dest_size, dest_mtime_ns = entry
+    return (
+        (size, mtime_ns, inode) == stat_key(src_stat)
+        and dest_size == dest_stat.st_size
+        and dest_mtime_ns == dest_stat.st_mtime_ns
+    )
@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = 9464  # 0 disables the HTTP endpoint
+METRIC_PREFIX = 'backup_'
+COUNTER_HELP = {
+    'files_scanned': 'Files examined',
+    'files_copied': 'Files written to the destination',
+    'files_unchanged': 'Files skipped as unchanged',
+    'bytes_hashed': 'Bytes read to compute checksums',
+    'bytes_copied': 'Logical bytes of the files backed up',
+    'bytes_transferred': 'Bytes actually written to the destination',
+    'errors': 'Files that failed to back up',
+}
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsRegistry:
+    """Live per-pair metrics: counters of the runs in progress plus totals and the last finished run.
+
+    backup_files registers its BackupStats for the duration of a run; the
+    registry reads them when scraped, so the backup path only pays for the
+    counter updates it already does.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}  # pair -> (BackupStats, full scan?) of the run in progress
+        self._totals = {}  # pair -> counters summed over finished runs
+        self._last = {}  # pair -> (counters, gauges) of the last finished run
+        self._runs = {}  # pair -> number of finished runs
+        self._expected = {}  # pair -> files seen by the last full run, for progress/ETA
+
+    def start_run(self, pair, stats, full_scan=True):
+        with self._lock:
+            self._active[pair] = (stats, full_scan)
+
+    def is_running(self, pair):
+        with self._lock:
+            return pair in self._active
+
+    def end_run(self, pair, stats, full_scan=True):
+        counters = stats.snapshot()
+        gauges = stats.gauges()
+        gauges['total_seconds'] = time.time() - stats.started
+        with self._lock:
+            self._active.pop(pair, None)
+            totals = self._totals.setdefault(pair, {})
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+            self._last[pair] = (counters, gauges)
+            self._runs[pair] = self._runs.get(pair, 0) + 1
+            if full_scan:
+                self._expected[pair] = counters.get('files_scanned', 0)
+
+    def progress(self):
+        """Return {pair: progress of the run in progress} with a fraction and ETA where known."""
+        with self._lock:
+            active = dict(self._active)
+            expected = dict(self._expected)
+        result = {}
+        now = time.time()
+        for pair, (stats, full_scan) in active.items():
+            counters = stats.snapshot()
+            scanned = counters.get('files_scanned', 0)
+            elapsed = now - stats.started
+            # Fully planned runs report their file count; streamed ones fall back to the last full run
+            expected_files = stats.gauges().get('files_expected') or (expected.get(pair, 0) if full_scan else 0)
+            total = max(expected_files, scanned)
+            fraction = scanned / total if total else None
+            eta = elapsed * (total - scanned) / scanned if scanned and total else None
+            work_queue = getattr(stats, 'work_queue', None)
+            result[pair] = dict(counters, files_expected=total, fraction=fraction, elapsed=elapsed, eta=eta,
+                                queue_depth=work_queue.qsize() if work_queue is not None else 0)
+        return result
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            active = dict(self._active)
+            totals = {pair: dict(values) for pair, values in self._totals.items()}
+            last = dict(self._last)
+            runs = dict(self._runs)
+        current = {pair: stats.snapshot() for pair, (stats, _full_scan) in active.items()}
+        progress = self.progress()
+        lines = []
+
+        for name, help_text in COUNTER_HELP.items():
+            metric = f"{METRIC_PREFIX}{name}_total"
+            lines.append(f"# HELP {metric} {help_text}, over all runs.")
+            lines.append(f"# TYPE {metric} counter")
+            for pair in sorted(set(totals) | set(current)):
+                value = totals.get(pair, {}).get(name, 0) + current.get(pair, {}).get(name, 0)
+                lines.append(f'{metric}{{pair="{_label(pair)}"}} {value}')
+
+        for name, help_text in COUNTER_HELP.items():
+            metric = f"{METRIC_PREFIX}run_{name}"
+            lines.append(f"# HELP {metric} {help_text}, in the run in progress or else the last run.")
+            lines.append(f"# TYPE {metric} gauge")
+            for pair in sorted(set(last) | set(current)):
+                counters = current[pair] if pair in current else last[pair][0]
+                lines.append(f'{metric}{{pair="{_label(pair)}"}} {counters.get(name, 0)}')
+
+        lines.append(f"# HELP {METRIC_PREFIX}phase_seconds Duration of each phase of the last finished run.")
+        lines.append(f"# TYPE {METRIC_PREFIX}phase_seconds gauge")
+        for pair in sorted(last):
+            for phase, seconds in sorted(last[pair][1].items()):
+                if phase.endswith('_seconds'):
+                    lines.append(f'{METRIC_PREFIX}phase_seconds{{pair="{_label(pair)}",phase="{phase[:-8]}"}} '
+                                 f'{seconds:.6f}')
+
+        for metric, help_text, key in (
+                ('queue_depth', 'Files queued for the backup workers.', 'queue_depth'),
+                ('run_progress_ratio', 'Fraction of the expected files scanned in the run in progress.', 'fraction'),
+                ('run_eta_seconds', 'Estimated seconds left in the run in progress.', 'eta')):
+            lines.append(f"# HELP {METRIC_PREFIX}{metric} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{metric} gauge")
+            for pair, values in sorted(progress.items()):
+                if values[key] is not None:
+                    lines.append(f'{METRIC_PREFIX}{metric}{{pair="{_label(pair)}"}} {values[key]}')
+
+        # Each family's HELP, TYPE and samples must be contiguous in the exposition format
+        pairs = sorted(set(runs) | set(current))
+        lines.append(f"# HELP {METRIC_PREFIX}running Whether a run of the pair is in progress.")
+        lines.append(f"# TYPE {METRIC_PREFIX}running gauge")
+        for pair in pairs:
+            lines.append(f'{METRIC_PREFIX}running{{pair="{_label(pair)}"}} {int(pair in current)}')
+        lines.append(f"# HELP {METRIC_PREFIX}runs_total Finished runs.")
+        lines.append(f"# TYPE {METRIC_PREFIX}runs_total counter")
+        for pair in pairs:
+            lines.append(f'{METRIC_PREFIX}runs_total{{pair="{_label(pair)}"}} {runs.get(pair, 0)}')
+        return '\n'.join(lines) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = self.server.registry.render().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/progress':
+            body = json.dumps(self.server.registry.progress()).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would otherwise flood the backup log
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /progress (JSON) on localhost."""
+
+    def __init__(self, registry, port=METRICS_PORT, host='127.0.0.1'):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server = None
+
+    def start(self):
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        except OSError as e:
+            logging.error(f"Error starting metrics endpoint on {self.host}:{self.port}: {e}")
+            return self
+        self._server.daemon_threads = True
+        self._server.registry = self.registry
+        threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True).start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
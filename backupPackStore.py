@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+from backupCopyEngine import BACKEND_AUTO, copy_file
+from backupManifest import is_unchanged
+
+PACKS_DIR = 'packs'
+PACK_INDEX = 'index.sqlite'
+PACK_THRESHOLD = 256 * 1024  # files below this size go into pack segments
+SEGMENT_SIZE = 256 * 1024 * 1024  # start a new segment once the current one reaches this size
+COMMIT_EVERY = 1000  # appended files between index commits
+
+class PackStore:
+    """Destination that appends small files into large append-only pack segments.
+
+    Files smaller than pack_threshold are appended to packs/segment-NNNNNN.pack and
+    an index (packs/index.sqlite) maps each path to (segment, offset, length), so a
+    tree of many tiny files becomes mostly sequential writes to one open file.
+    Larger files are stored individually at their mirror path. A changed small file
+    is appended again; the superseded bytes stay in the old segment. A file that
+    crosses pack_threshold loses its copy in the other form, and remove/remove_tree
+    drop deleted files from the index.
+    """
+
+    dest_root = None  # the walk does not pre-create mirror directories
+
+    def __init__(self, dest_dir, pack_threshold=PACK_THRESHOLD, segment_size=SEGMENT_SIZE):
+        self.dest_dir = dest_dir
+        self.pack_threshold = pack_threshold
+        self.segment_size = segment_size
+        self.packs_dir = os.path.join(dest_dir, PACKS_DIR)
+        os.makedirs(self.packs_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(os.path.join(self.packs_dir, PACK_INDEX), check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS packed ("
+            "path TEXT PRIMARY KEY, segment INTEGER, offset INTEGER, length INTEGER, "
+            "mtime_ns INTEGER, checksum TEXT)"
+        )
+        row = self._index.execute("SELECT MAX(segment) FROM packed").fetchone()
+        self._segment = row[0] or 1
+        self._segment_file = None
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._segment_file is not None:
+                self._segment_file.close()
+                self._segment_file = None
+            self._index.commit()
+            self._index.close()
+
+    def segment_path(self, segment):
+        return os.path.join(self.packs_dir, f"segment-{segment:06d}.pack")
+
+    def _open_segment(self):
+        """Return the segment file to append to, rolling over when it is full."""
+        if self._segment_file is None:
+            self._segment_file = open(self.segment_path(self._segment), 'ab')
+        if self._segment_file.tell() >= self.segment_size:
+            self._segment_file.close()
+            self._segment += 1
+            self._segment_file = open(self.segment_path(self._segment), 'ab')
+        return self._segment_file
+
+    def _packed_entry(self, rel_file):
+        with self._lock:
+            return self._index.execute(
+                "SELECT segment, offset, length, mtime_ns, checksum FROM packed WHERE path = ?", (rel_file,)
+            ).fetchone()
+
+    def _append(self, rel_file, data, src_stat, checksum):
+        with self._lock:
+            segment_file = self._open_segment()
+            offset = segment_file.tell()
+            segment_file.write(data)
+            segment_file.flush()
+            self._index.execute(
+                "INSERT OR REPLACE INTO packed VALUES (?, ?, ?, ?, ?, ?)",
+                (rel_file, self._segment, offset, len(data), src_stat.st_mtime_ns, checksum),
+            )
+            self._commit_later()
+
+    def _commit_later(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._index.commit()
+            self._pending = 0
+
+    def remove(self, rel_file):
+        """Drop the index entry of a file deleted from the source."""
+        with self._lock:
+            self._index.execute("DELETE FROM packed WHERE path = ?", (rel_file,))
+            self._commit_later()
+
+    def remove_tree(self, rel_path):
+        """Drop the index entries of rel_path and, if it was a directory, everything under it."""
+        with self._lock:
+            self._index.execute("DELETE FROM packed WHERE path = ? OR substr(path, 1, ?) = ?",
+                                (rel_path, len(rel_path) + 1, rel_path + os.sep))
+            self._commit_later()
+
+    def backup(self, src_file, dest_file, rel_file, src_stat, manifest, options):
+        """Pack or copy src_file; None when the stored copy is current."""
+        entry = manifest.get(rel_file)
+        if src_stat.st_size < self.pack_threshold:
+            packed = self._packed_entry(rel_file)
+            if entry is not None and packed is not None:
+                packed_stat = SimpleNamespace(st_size=packed[2], st_mtime_ns=packed[3])
+                if is_unchanged(entry, src_stat, packed_stat) and packed[4] == entry[3]:
+                    return None
+            with open(src_file, 'rb') as f:
+                data = f.read()
+            checksum = hashlib.md5(data).hexdigest()
+            self._append(rel_file, data, src_stat, checksum)
+            manifest.record(rel_file, src_stat, checksum, SimpleNamespace(st_size=len(data),
+                                                                          st_mtime_ns=src_stat.st_mtime_ns))
+            if os.path.isfile(dest_file):
+                os.remove(dest_file)  # stored loose while it was at or above pack_threshold
+            return checksum, 'pack', len(data)
+
+        if entry is not None:
+            try:
+                if is_unchanged(entry, src_stat, os.stat(dest_file)):
+                    return None
+            except FileNotFoundError:
+                pass
+        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+        checksum, backend = copy_file(src_file, dest_file, options.get('copy_backend', BACKEND_AUTO), src_stat.st_size)
+        manifest.record(rel_file, src_stat, checksum, os.stat(dest_file))
+        if self._packed_entry(rel_file) is not None:
+            self.remove(rel_file)  # packed while it was below pack_threshold
+        return checksum, backend, src_stat.st_size
+
+    def read_file(self, rel_file):
+        """Return the bytes of a packed file, or None if rel_file is not packed."""
+        packed = self._packed_entry(rel_file)
+        if packed is None:
+            return None
+        segment, offset, length, _mtime_ns, checksum = packed
+        try:
+            with open(self.segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                data = f.read(length)
+            if hashlib.md5(data).hexdigest() != checksum:
+                raise ValueError(f"Checksum mismatch reading packed file {rel_file}")
+            return data
+        except Exception as e:
+            logging.error(f"Error reading packed file {rel_file}: {e}")
+            raise
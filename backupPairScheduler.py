@@ -0,0 +1,71 @@
+import logging
+import os
+import time
+from threading import Thread
+
+def device_of(path):
+    """Return st_dev of path, or of its nearest existing parent if it does not exist yet."""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+def group_pairs_by_device(pairs):
+    """Group (src_dir, dest_dir) pairs so that pairs touching a common device share a group.
+
+    Two pairs land in the same group when any of their source or destination
+    devices overlap, directly or through another pair. Groups are independent
+    and can run in parallel; pairs inside a group must run one after another.
+    """
+    groups = []  # list of (device set, pair list)
+    for src_dir, dest_dir in pairs:
+        try:
+            devices = {device_of(src_dir), device_of(dest_dir)}
+        except Exception as e:
+            logging.error(f"Error resolving device for {src_dir} -> {dest_dir}: {e}")
+            devices = set()
+        merged_devices, merged_pairs = set(devices), [(src_dir, dest_dir)]
+        remaining = []
+        for group_devices, group_pairs in groups:
+            if devices and group_devices & devices:
+                merged_devices |= group_devices
+                merged_pairs = group_pairs + merged_pairs
+            else:
+                remaining.append((group_devices, group_pairs))
+        groups = remaining + [(merged_devices, merged_pairs)]
+    return [group_pairs for _devices, group_pairs in groups]
+
+def _run_group(group, run_pair, durations):
+    for src_dir, dest_dir in group:
+        start = time.monotonic()
+        try:
+            run_pair(src_dir, dest_dir)
+        except Exception as e:
+            logging.error(f"Error backing up pair {src_dir} -> {dest_dir}: {e}")
+        duration = time.monotonic() - start
+        durations[(src_dir, dest_dir)] = duration
+        logging.info(f"Pair cycle time: {src_dir} -> {dest_dir} | Duration: {duration:.2f}s")
+
+def run_pairs(pairs, run_pair):
+    """Run run_pair(src_dir, dest_dir) for every pair, in parallel across independent devices.
+
+    Returns a dict mapping each (src_dir, dest_dir) pair to its cycle time in seconds.
+    """
+    durations = {}
+    groups = group_pairs_by_device(pairs)
+    if len(groups) <= 1:
+        for group in groups:
+            _run_group(group, run_pair, durations)
+        return durations
+
+    threads = [Thread(target=_run_group, args=(group, run_pair, durations), daemon=True) for group in groups]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return durations
@@ -0,0 +1,191 @@
+import os
+import shutil
+import time
+
+from backupManifest import is_unchanged, stat_key
+from backupWalker import walk_paths, walk_tree
+
+ACTION_NEW = 'new'
+ACTION_MODIFIED = 'modified'
+ACTION_UNCHANGED = 'unchanged'
+ACTION_DELETED = 'deleted'
+ACTIONS = (ACTION_NEW, ACTION_MODIFIED, ACTION_UNCHANGED, ACTION_DELETED)
+DEFAULT_COPY_RATE = 50 * 1024 * 1024  # bytes/s assumed until a pair has a measured run
+DEFAULT_CHECK_RATE = 5000  # files/s examined, likewise
+RATE_COPY_KEY = 'copy_bytes_per_second'  # manifest meta keys holding the measured rates
+RATE_CHECK_KEY = 'files_per_second'
+
+class InsufficientSpace(OSError):
+    """The destination does not have room for the files a plan would copy."""
+
+def free_bytes(path):
+    """Free bytes on the filesystem holding path, or of its nearest existing parent."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return shutil.disk_usage(path).free
+
+class BackupPlan:
+    """What one backup_files run would do, worked out from stat data and the manifest alone.
+
+    dirs holds (rel_dir, [(action, name, src_file, src_stat, dest_file, rel_file)],
+    unchanged) in walk order so the executor can mirror directories as it goes.
+    Unchanged files are only counted in unchanged, unless the plan keeps them
+    (keep_unchanged), so memory grows with the changes rather than the tree. In a
+    streamed plan dirs is a generator that walks the tree as the executor consumes
+    it; totals and deleted are complete once it is exhausted. Modified files marked
+    unverified have a destination copy but no manifest entry yet; the executor
+    hashes both sides and may still find them identical.
+    """
+
+    def __init__(self, src_dir, dest_dir, full_scan=True):
+        self.src_dir = src_dir
+        self.dest_dir = dest_dir
+        self.full_scan = full_scan
+        self.created = time.time()
+        self.dirs = []
+        self.deleted = []  # (rel_path, recorded size or 0)
+        self.missing = []  # watch-mode paths that no longer exist; dropped from the manifest as whole trees
+        self.unverified = 0
+        self.growth = 0  # bytes modified files add to their destination copies
+        self.largest_rewrite = 0  # the biggest temp copy that coexists with the file it replaces
+        self._totals = {action: [0, 0] for action in ACTIONS}  # action -> [files, bytes]
+
+    def add(self, action, size):
+        totals = self._totals[action]
+        totals[0] += 1
+        totals[1] += size
+
+    def totals(self):
+        return {action: {'files': files, 'bytes': size} for action, (files, size) in self._totals.items()}
+
+    @property
+    def file_count(self):
+        return sum(files for action, (files, _size) in self._totals.items() if action != ACTION_DELETED)
+
+    @property
+    def change_count(self):
+        """New, modified and deleted files."""
+        return sum(self._totals[action][0] for action in (ACTION_NEW, ACTION_MODIFIED, ACTION_DELETED))
+
+    @property
+    def bytes_to_copy(self):
+        return self._totals[ACTION_NEW][1] + self._totals[ACTION_MODIFIED][1]
+
+    @property
+    def bytes_needed(self):
+        """Free space the run needs: new files, the growth of modified ones and one temp copy."""
+        return self._totals[ACTION_NEW][1] + self.growth + self.largest_rewrite
+
+    def eta(self, copy_rate=DEFAULT_COPY_RATE, check_rate=DEFAULT_CHECK_RATE):
+        """Estimated seconds to execute the plan at the given throughput."""
+        return self.bytes_to_copy / max(copy_rate, 1) + self.file_count / max(check_rate, 1)
+
+    def to_dict(self, copy_rate=DEFAULT_COPY_RATE, check_rate=DEFAULT_CHECK_RATE, include_unchanged=False):
+        """JSON-ready plan: totals, ETA, free-space check and the files that would change."""
+        try:
+            available = free_bytes(self.dest_dir)
+        except OSError:
+            available = None
+        files = [{'path': rel_file, 'action': action, 'size': src_stat.st_size}
+                 for _rel_dir, entries, _unchanged in self.dirs
+                 for action, _name, _src_file, src_stat, _dest_file, rel_file in entries
+                 if include_unchanged or action != ACTION_UNCHANGED]
+        files.extend({'path': rel_path, 'action': ACTION_DELETED, 'size': size} for rel_path, size in self.deleted)
+        return {
+            'src_dir': self.src_dir,
+            'dest_dir': self.dest_dir,
+            'created': self.created,
+            'full_scan': self.full_scan,
+            'totals': self.totals(),
+            'unverified': self.unverified,
+            'bytes_to_copy': self.bytes_to_copy,
+            'bytes_needed': self.bytes_needed,
+            'free_bytes': available,
+            'fits': available is None or self.bytes_needed <= available,
+            'eta_seconds': self.eta(copy_rate, check_rate),
+            'files': files,
+        }
+
+    def check_free_space(self):
+        """Raise InsufficientSpace if the files to copy cannot fit on the destination."""
+        available = free_bytes(self.dest_dir)
+        if self.bytes_needed > available:
+            raise InsufficientSpace(f"{self.dest_dir} needs {self.bytes_needed} bytes but has {available} free")
+
+def _classify(entry, src_stat, dest_file, source_only):
+    """Return (action, unverified, destination size) for one file from its manifest entry and stat data."""
+    if source_only:
+        # Stores keep their own layout; the manifest's source stat is all we can compare without them
+        if entry is None:
+            return ACTION_NEW, False, 0
+        return (ACTION_UNCHANGED if tuple(entry[:3]) == stat_key(src_stat) else ACTION_MODIFIED), False, 0
+    try:
+        dest_stat = os.stat(dest_file)
+    except FileNotFoundError:
+        return ACTION_NEW, False, 0
+    if entry is None:
+        return ACTION_MODIFIED, True, dest_stat.st_size
+    unchanged = is_unchanged(entry, src_stat, dest_stat)
+    return (ACTION_UNCHANGED if unchanged else ACTION_MODIFIED), False, dest_stat.st_size
+
+def _plan_dirs(plan, tree, dest_dir, manifest, rel_paths, source_only, keep_unchanged):
+    seen_paths = set()
+    for relative_path, files in tree:
+        dest_path = os.path.join(dest_dir, relative_path) if relative_path else dest_dir
+        entries = []
+        unchanged = 0
+        for name, src_file, src_stat in files:
+            rel_file = os.path.join(relative_path, name)
+            dest_file = os.path.join(dest_path, name)
+            seen_paths.add(rel_file)
+            entry = manifest.get(rel_file) if manifest is not None else None
+            action, unverified, dest_size = _classify(entry, src_stat, dest_file, source_only)
+            plan.add(action, src_stat.st_size)
+            if action == ACTION_MODIFIED:
+                plan.unverified += unverified
+                plan.growth += max(0, src_stat.st_size - dest_size)
+                if not unverified:
+                    # Unverified copies are usually identical and then never rewritten
+                    plan.largest_rewrite = max(plan.largest_rewrite, src_stat.st_size)
+            if action == ACTION_UNCHANGED and not keep_unchanged:
+                unchanged += 1
+            else:
+                entries.append((action, name, src_file, src_stat, dest_file, rel_file))
+        yield relative_path, entries, unchanged
+
+    if manifest is not None:
+        stale = [path for path in manifest.paths() if path not in seen_paths] if rel_paths is None else plan.missing
+        for rel_path in stale:
+            entry = manifest.get(rel_path)
+            size = entry[0] if entry is not None else 0
+            plan.deleted.append((rel_path, size))
+            plan.add(ACTION_DELETED, size)
+
+def plan_backup(src_dir, dest_dir, manifest=None, rel_paths=None, source_only=False, wrap_tree=None,
+                keep_unchanged=False, stream=False):
+    """Walk src_dir and classify every file as new, modified or unchanged, and manifest entries as deleted.
+
+    No file contents are read. dest_dir is where the files are mirrored (a
+    store's dest_root). With source_only (stores), the destination is not
+    stat-ed and only the recorded source stat decides. rel_paths limits the plan
+    to those paths, as in watch mode. wrap_tree, if given, wraps the walk
+    generator (e.g. to time each directory). keep_unchanged lists unchanged
+    files in dirs instead of only counting them. With stream the walk happens
+    while the executor iterates dirs, so copying overlaps it, but the totals
+    are not known up front.
+    """
+    plan = BackupPlan(src_dir, dest_dir, rel_paths is None)
+    if rel_paths is None:
+        tree = walk_tree(src_dir)
+    else:
+        tree = walk_paths(src_dir, rel_paths, missing=plan.missing)
+    if wrap_tree is not None:
+        tree = wrap_tree(tree)
+    plan.dirs = _plan_dirs(plan, tree, dest_dir, manifest, rel_paths, source_only, keep_unchanged)
+    if not stream:
+        plan.dirs = list(plan.dirs)
+    return plan
@@ -0,0 +1,199 @@
+import cProfile
+import heapq
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import nullcontext
+
+PROFILE_OFF = 'off'
+PROFILE_PHASES = 'phases'  # per-phase timings and slowest files/directories in the log
+PROFILE_CPROFILE = 'cprofile'  # phases plus a .prof file of one cycle, for pstats/snakeviz
+PROFILE_TRACE = 'trace'  # phases plus a Chrome trace-event .json of one cycle, for chrome://tracing or Perfetto
+PROFILE_MODES = (PROFILE_OFF, PROFILE_PHASES, PROFILE_CPROFILE, PROFILE_TRACE)
+PROFILE_DIR = 'Profiles'
+SLOWEST_COUNT = 10  # slowest files and directories reported per cycle
+
+_NULL_CONTEXT = nullcontext()
+
+class NullProfiler:
+    """Profiler used when profiling is off: every hook is a no-op returning a shared context."""
+    enabled = False
+
+    def phase(self, name, **args):
+        return _NULL_CONTEXT
+
+    def file(self, rel_path):
+        return _NULL_CONTEXT
+
+    def thread(self):
+        return _NULL_CONTEXT
+
+    def walk(self, tree):
+        return tree
+
+NULL_PROFILER = NullProfiler()
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'args', 'started')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.add(self.name, self.started, time.perf_counter() - self.started, self.args)
+
+class _File(_Phase):
+    __slots__ = ()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.file_done(self.name, self.started, time.perf_counter() - self.started)
+
+class _ThreadProfile:
+    """Runs cProfile in the current thread unless an outer _ThreadProfile already does."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.profile = None
+
+    def __enter__(self):
+        local = self.profiler._local
+        if not getattr(local, 'active', False):
+            local.active = True
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profiler._local.active = False
+            with self.profiler._lock:
+                self.profiler._profiles.append(self.profile)
+
+class CycleProfiler:
+    """Per-phase timings and the slowest files and directories of one backup cycle.
+
+    Phase times are summed over threads, so with several workers they add up to
+    more than the wall time. In cprofile mode every thread that enters thread()
+    is profiled and the results are merged; in trace mode each phase becomes a
+    trace event. The profiler is shared by the pairs and workers of the cycle.
+    """
+    enabled = True
+
+    def __init__(self, mode=PROFILE_PHASES, slowest=SLOWEST_COUNT):
+        self.mode = mode
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._phases = {}  # name -> [seconds, count]
+        self._slow_files = []  # min-heap of (seconds, rel_path)
+        self._dir_seconds = {}  # rel_dir -> seconds spent listing it and backing up its files
+        self._events = []
+        self._profiles = []
+        self._origin = time.perf_counter()
+
+    def phase(self, name, **args):
+        """Context manager timing one occurrence of a phase; args label the trace event."""
+        return _Phase(self, name, args)
+
+    def file(self, rel_path):
+        """Context manager timing the whole backup of one file."""
+        return _File(self, rel_path, None)
+
+    def thread(self):
+        """Context manager to wrap a thread's work in; profiles it in cprofile mode."""
+        if self.mode == PROFILE_CPROFILE:
+            return _ThreadProfile(self)
+        return _NULL_CONTEXT
+
+    def walk(self, tree):
+        """Wrap a walk_tree generator, timing the listing and stat of each directory."""
+        iterator = iter(tree)
+        while True:
+            started = time.perf_counter()
+            try:
+                rel_dir, files = next(iterator)
+            except StopIteration:
+                return
+            seconds = time.perf_counter() - started
+            self.add('walk', started, seconds, {'dir': rel_dir})
+            with self._lock:
+                self._dir_seconds[rel_dir] = self._dir_seconds.get(rel_dir, 0) + seconds
+            yield rel_dir, files
+
+    def add(self, name, started, seconds, args=None):
+        with self._lock:
+            totals = self._phases.get(name)
+            if totals is None:
+                self._phases[name] = [seconds, 1]
+            else:
+                totals[0] += seconds
+                totals[1] += 1
+            if self.mode == PROFILE_TRACE:
+                self._events.append({'name': name, 'cat': 'backup', 'ph': 'X', 'pid': os.getpid(),
+                                     'tid': threading.get_ident(), 'ts': (started - self._origin) * 1e6,
+                                     'dur': seconds * 1e6, 'args': args or {}})
+
+    def file_done(self, rel_path, started, seconds):
+        with self._lock:
+            if len(self._slow_files) < self.slowest:
+                heapq.heappush(self._slow_files, (seconds, rel_path))
+            elif seconds > self._slow_files[0][0]:
+                heapq.heapreplace(self._slow_files, (seconds, rel_path))
+            rel_dir = os.path.dirname(rel_path)
+            self._dir_seconds[rel_dir] = self._dir_seconds.get(rel_dir, 0) + seconds
+        self.add('file', started, seconds, {'path': rel_path})
+
+    def phase_seconds(self):
+        with self._lock:
+            return {name: seconds for name, (seconds, _count) in self._phases.items()}
+
+    def slowest_files(self):
+        with self._lock:
+            return [(rel_path, seconds) for seconds, rel_path in sorted(self._slow_files, reverse=True)]
+
+    def slowest_dirs(self):
+        with self._lock:
+            return heapq.nlargest(self.slowest, self._dir_seconds.items(), key=lambda item: item[1])
+
+    def summary(self):
+        with self._lock:
+            phases = sorted(self._phases.items(), key=lambda item: -item[1][0])
+        parts = [f"{name}: {seconds:.3f}s/{count}" for name, (seconds, count) in phases]
+        files = ", ".join(f"{rel_path} ({seconds:.3f}s)" for rel_path, seconds in self.slowest_files())
+        dirs = ", ".join(f"{rel_dir or '.'} ({seconds:.3f}s)" for rel_dir, seconds in self.slowest_dirs())
+        return f"Phases: {', '.join(parts)} | Slowest files: {files} | Slowest directories: {dirs}"
+
+    def write(self, output_dir=PROFILE_DIR):
+        """Write the cProfile stats or trace of the cycle to output_dir; return the path or None."""
+        if self.mode not in (PROFILE_CPROFILE, PROFILE_TRACE):
+            return None
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            if self.mode == PROFILE_CPROFILE:
+                with self._lock:
+                    profiles = list(self._profiles)
+                if not profiles:
+                    return None
+                path = os.path.join(output_dir, f"cycle-{stamp}.prof")
+                pstats.Stats(*profiles).dump_stats(path)
+            else:
+                path = os.path.join(output_dir, f"cycle-{stamp}.trace.json")
+                with self._lock:
+                    events = list(self._events)
+                with open(path, 'w') as f:
+                    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+            return path
+        except Exception as e:
+            logging.error(f"Error writing profile to {output_dir}: {e}")
+            return None
@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import os
+import shutil
+import zlib
+from array import array
+
+from backupCopyEngine import BACKEND_AUTO, BACKEND_BUFFERED, copy_file, reflink_file
+from backupDeltaSync import DELTA_TEMP_SUFFIX
+from backupManifest import stat_key
+
+RESUME_THRESHOLD = 64 * 1024 * 1024  # files at least this large are copied through the transfer journal
+RESUME_BLOCK_SIZE = 4 * 1024 * 1024  # granularity of the block checksums a resume is verified against
+CHECKPOINT_BYTES = 64 * 1024 * 1024  # data copied between two journal checkpoints
+TEMP_SUFFIX = '.backup-part'
+
+def temp_path_for(dest_file):
+    """Hidden temp file beside dest_file that a copy is written to before it is renamed into place."""
+    dest_dir, dest_name = os.path.split(dest_file)
+    return os.path.join(dest_dir, f".{dest_name}{TEMP_SUFFIX}")
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def copy_via_temp(src_file, dest_file, backend=BACKEND_AUTO, size=None, publish=None):
+    """copy_file into a temp file and rename it over dest_file; return (checksum, backend used).
+
+    dest_file is either the old copy or the complete new one, never a partial write.
+    publish(temp_file, checksum), if given, moves the temp file into place instead.
+    """
+    temp_file = temp_path_for(dest_file)
+    try:
+        result = copy_file(src_file, temp_file, backend, size)
+        if publish is None:
+            os.replace(temp_file, dest_file)
+        else:
+            publish(temp_file, result[0])
+        return result
+    except BaseException:
+        _remove_quietly(temp_file)
+        raise
+
+def _verified_prefix(temp_file, checksums, block_size, md5):
+    """Return how many leading blocks of temp_file match checksums, feeding those blocks into md5."""
+    verified = 0
+    with open(temp_file, 'rb') as f:
+        for expected in checksums:
+            block = f.read(block_size)
+            if len(block) < block_size or zlib.crc32(block) != expected:
+                break
+            md5.update(block)
+            verified += 1
+    return verified
+
+def resumable_copy(src_file, dest_file, src_stat, manifest, rel_file, block_size=RESUME_BLOCK_SIZE,
+                   checkpoint_bytes=CHECKPOINT_BYTES, publish=None, backend=BACKEND_AUTO):
+    """Copy a large file through a temp file, journaling progress so an interrupted copy can resume.
+
+    Unless backend is 'buffered', a copy with nothing to resume is first tried
+    as a reflink, which shares extents in O(1) and needs no journal.
+    Every checkpoint_bytes the CRC32 of each block written so far is committed to
+    the manifest's transfer journal. If the journal holds an entry for rel_file
+    whose source stat still matches, the temp file's blocks are checked against
+    it and the copy continues after the last block that verifies; otherwise it
+    starts from zero. The finished temp file is renamed over dest_file, or handed
+    to publish(temp_file, checksum, on_published), and the entry removed once it
+    is in place. Returns (checksum, backend, bytes transferred).
+    """
+    temp_file = temp_path_for(dest_file)
+    md5 = hashlib.md5()
+    checksums = array('I')
+    offset = 0
+    entry = manifest.get_transfer(rel_file)
+    if entry is not None:
+        journal_temp, size, mtime_ns, inode, journal_block_size, block_checksums = entry
+        if ((size, mtime_ns, inode) == stat_key(src_stat) and journal_temp == temp_file
+                and journal_block_size == block_size and os.path.exists(temp_file)):
+            checksums.frombytes(block_checksums)
+            verified = _verified_prefix(temp_file, checksums, block_size, md5)
+            del checksums[verified:]
+            offset = verified * block_size
+            logging.info(f"Resuming copy of {src_file} at {offset} of {src_stat.st_size} bytes")
+
+    if not offset and backend != BACKEND_BUFFERED:
+        try:
+            checksum = reflink_file(src_file, temp_file, src_stat.st_size)
+            if checksum is not None:
+                if publish is None:
+                    os.replace(temp_file, dest_file)
+                    manifest.remove_transfer(rel_file)
+                else:
+                    publish(temp_file, checksum, lambda: manifest.remove_transfer(rel_file))
+                return checksum, 'reflink', src_stat.st_size
+        except BaseException:
+            _remove_quietly(temp_file)
+            raise
+
+    with open(src_file, 'rb') as f_in, open(temp_file, 'r+b' if offset else 'wb') as f_out:
+        f_out.truncate(offset)
+        f_out.seek(offset)
+        f_in.seek(offset)
+        manifest.save_transfer(rel_file, temp_file, src_stat, block_size, checksums.tobytes())
+        buffer = bytearray(block_size)
+        view = memoryview(buffer)
+        pending = 0
+        while True:
+            read = f_in.readinto(buffer)
+            if not read:
+                break
+            md5.update(view[:read])
+            checksums.append(zlib.crc32(view[:read]))
+            f_out.write(view[:read])
+            pending += read
+            if pending >= checkpoint_bytes:
+                f_out.flush()  # the journal must never describe blocks still in our buffer
+                manifest.save_transfer(rel_file, temp_file, src_stat, block_size, checksums.tobytes())
+                pending = 0
+    shutil.copystat(src_file, temp_file)
+    if publish is None:
+        os.replace(temp_file, dest_file)
+        manifest.remove_transfer(rel_file)
+    else:
+        publish(temp_file, md5.hexdigest(), lambda: manifest.remove_transfer(rel_file))
+    return md5.hexdigest(), 'resumed' if offset else 'journaled', src_stat.st_size - offset
+
+def sweep_temp_files(dest_dir, manifest):
+    """Remove temp files that interrupted copies left under dest_dir; return how many were removed.
+
+    Covers every writer that builds a file beside its destination: copies and
+    stores (temp_path_for) and block deltas. Temp files of journaled transfers
+    are kept so those copies can still resume.
+    """
+    journaled = {temp_file for _rel_path, temp_file in manifest.transfers()}
+    removed = 0
+    for root, _dirs, files in os.walk(dest_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.startswith('.') and name.endswith((TEMP_SUFFIX, DELTA_TEMP_SUFFIX)) and path not in journaled:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    logging.error(f"Error removing interrupted copy {path}: {e}")
+    return removed
+
+def discard_stale_transfers(manifest, src_dir):
+    """Drop journaled copies whose source file is gone, removing their temp files."""
+    for rel_path, temp_file in manifest.transfers():
+        if not os.path.exists(os.path.join(src_dir, rel_path)):
+            try:
+                _remove_quietly(temp_file)
+                manifest.remove_transfer(rel_path)
+            except OSError as e:
+                logging.error(f"Error removing interrupted copy {temp_file}: {e}")
@@ -0,0 +1,171 @@
+import errno
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+from backupCopyEngine import BACKEND_AUTO, copy_file
+from backupManifest import is_unchanged
+
+SNAPSHOTS_DIR = 'snapshots'
+OBJECTS_DIR = 'objects'
+PARTIAL_SUFFIX = '.partial'
+SNAPSHOT_KEEP = 30  # snapshots kept per destination; 0 keeps all
+
+class SnapshotStore:
+    """Versioned destination: one timestamped snapshot directory per backup cycle.
+
+    File contents live once in a content-addressed object store (objects/ab/<md5>)
+    and every snapshot is a tree of hardlinks into it, so a file that did not change
+    since the previous snapshot costs one link() and no data copy. A snapshot is
+    built under a '.partial' name and renamed into place only when the cycle ends;
+    a cycle with nothing to add to the latest snapshot builds none. Hardlinks
+    share one inode, so all snapshots see the metadata of the first copy of a
+    given content.
+    """
+
+    def __init__(self, dest_dir, keep=SNAPSHOT_KEEP):
+        self.dest_dir = dest_dir
+        self.keep = keep
+        self.snapshots_dir = os.path.join(dest_dir, SNAPSHOTS_DIR)
+        self.objects_dir = os.path.join(dest_dir, OBJECTS_DIR)
+        self.dest_root = None
+        self.name = None
+
+    def object_path(self, checksum):
+        return os.path.join(self.objects_dir, checksum[:2], checksum)
+
+    def snapshots(self):
+        """Completed snapshot names, oldest first."""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(name for name in os.listdir(self.snapshots_dir) if not name.endswith(PARTIAL_SUFFIX))
+
+    def prepare(self):
+        """Name the next snapshot and return the directory it will be built in, without creating it."""
+        base_name = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        self.name = base_name
+        counter = 1
+        while os.path.exists(os.path.join(self.snapshots_dir, self.name)):
+            self.name = f"{base_name}_{counter}"
+            counter += 1
+        self.dest_root = os.path.join(self.snapshots_dir, self.name + PARTIAL_SUFFIX)
+        return self.dest_root
+
+    def begin(self):
+        """Start the prepared (or a new) snapshot and return the directory files are linked into."""
+        if self.name is None:
+            self.prepare()
+        os.makedirs(self.dest_root, exist_ok=True)
+        os.makedirs(os.path.join(self.objects_dir, 'tmp'), exist_ok=True)
+        return self.dest_root
+
+    def commit(self):
+        """Publish the snapshot under its final name and apply retention."""
+        final = os.path.join(self.snapshots_dir, self.name)
+        os.replace(self.dest_root, final)
+        self.dest_root = final
+        logging.info(f"Snapshot complete: {final}")
+        self.expire()
+        return final
+
+    def abort(self):
+        if self.dest_root and self.dest_root.endswith(PARTIAL_SUFFIX) and os.path.isdir(self.dest_root):
+            shutil.rmtree(self.dest_root, ignore_errors=True)
+
+    def discard(self):
+        """Drop the snapshot in progress when it adds nothing to the latest one."""
+        self.abort()
+        logging.info(f"Snapshot skipped, nothing changed: {self.name}")
+
+    def expire(self):
+        """Delete snapshots beyond the retention count, then objects nothing links to."""
+        if not self.keep:
+            return
+        expired = self.snapshots()[:-self.keep]
+        for name in expired:
+            shutil.rmtree(os.path.join(self.snapshots_dir, name), ignore_errors=True)
+            logging.info(f"Snapshot expired: {name}")
+        if expired:
+            self.collect_garbage()
+
+    def collect_garbage(self):
+        """Remove objects whose only remaining link is the object store itself."""
+        removed = 0
+        temp_dir = os.path.join(self.objects_dir, 'tmp')
+        for root, _dirs, files in os.walk(self.objects_dir):
+            if root == temp_dir:
+                continue
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_nlink <= 1:
+                        os.remove(path)
+                        removed += 1
+                except OSError as e:
+                    logging.error(f"Error collecting object {path}: {e}")
+        return removed
+
+    def _store_object(self, src_file, src_stat, options):
+        """Copy src_file into the object store; return (checksum, backend, bytes transferred)."""
+        temp_file = os.path.join(self.objects_dir, 'tmp', uuid.uuid4().hex)
+        try:
+            checksum, backend = copy_file(src_file, temp_file, options.get('copy_backend', BACKEND_AUTO),
+                                          src_stat.st_size)
+            object_file = self.object_path(checksum)
+            if os.path.exists(object_file):
+                os.remove(temp_file)  # content already stored by another file or snapshot
+                return checksum, 'dedup', 0
+            os.makedirs(os.path.dirname(object_file), exist_ok=True)
+            os.replace(temp_file, object_file)
+            return checksum, backend, src_stat.st_size
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def _link(self, object_file, dest_file):
+        """Hardlink object_file as dest_file, replacing an object at the link limit with a fresh copy.
+
+        Identical content (every empty file, say) shares one object, and ext4
+        allows 65000 links per inode (NTFS 1023). Older snapshots keep the old
+        inode; the copy keeps its mtime, so manifest entries still match.
+        """
+        try:
+            os.link(object_file, dest_file)
+        except OSError as e:
+            if e.errno != errno.EMLINK:
+                raise
+            temp_file = os.path.join(self.objects_dir, 'tmp', uuid.uuid4().hex)
+            try:
+                shutil.copy2(object_file, temp_file)
+                os.replace(temp_file, object_file)
+            except BaseException:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                raise
+            os.link(object_file, dest_file)
+
+    def backup(self, src_file, dest_file, rel_file, src_stat, manifest, options):
+        """Link rel_file into the current snapshot, storing new content first.
+
+        Returns None when the file was unchanged (metadata-only link), otherwise
+        (checksum, backend, bytes transferred).
+        """
+        entry = manifest.get(rel_file)
+        if entry is not None:
+            object_file = self.object_path(entry[3])
+            try:
+                object_stat = os.stat(object_file)
+            except FileNotFoundError:
+                object_stat = None
+            if object_stat is not None and is_unchanged(entry, src_stat, object_stat):
+                self._link(object_file, dest_file)
+                return None
+
+        checksum, backend, transferred = self._store_object(src_file, src_stat, options)
+        object_file = self.object_path(checksum)
+        self._link(object_file, dest_file)
+        manifest.record(rel_file, src_stat, checksum, os.stat(object_file))
+        return checksum, backend, transferred
@@ -0,0 +1,42 @@
+import threading
+import time
+
+class BackupStats:
+    """Thread-safe counters for one backup run of a source/dest pair.
+
+    Gauges (set()) hold point-in-time values such as phase durations; they are
+    exported as metrics but kept out of the summary line.
+    """
+
+    def __init__(self, src_dir='', dest_dir=''):
+        self.src_dir = src_dir
+        self.dest_dir = dest_dir
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def gauges(self):
+        with self._lock:
+            return dict(self._gauges)
+
+    def get(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def summary(self):
+        counters = self.snapshot()
+        parts = [f"{name}: {value}" for name, value in sorted(counters.items())]
+        return f"{self.src_dir} -> {self.dest_dir} | " + ", ".join(parts)
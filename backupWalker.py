@@ -0,0 +1,91 @@
+import logging
+import os
+import stat
+import threading
+
+EXCLUDED_DIRS = ('.stfolder',)
+
+def walk_tree(src_dir, exclude_dirs=EXCLUDED_DIRS, start=''):
+    """Walk src_dir with os.scandir, yielding (rel_dir, files) one directory at a time.
+
+    files is a list of (name, path, stat_result) so callers reuse the stat fetched
+    during the walk instead of stat-ing each file again. rel_dir is '' for the root.
+    Like os.walk, symlinked directories are not followed and unreadable directories
+    are logged and skipped. start limits the walk to one relative subdirectory.
+    """
+    pending = [start]
+    while pending:
+        rel_dir = pending.pop()
+        dir_path = os.path.join(src_dir, rel_dir) if rel_dir else src_dir
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if entry.name not in exclude_dirs and not entry.is_symlink():
+                                subdirs.append(os.path.join(rel_dir, entry.name))
+                            continue
+                        files.append((entry.name, entry.path, entry.stat()))
+                    except OSError as e:
+                        logging.error(f"Error reading entry {entry.path}: {e}")
+        except OSError as e:
+            logging.error(f"Error scanning directory {dir_path}: {e}")
+            continue
+        yield rel_dir, files
+        pending.extend(reversed(subdirs))
+
+def walk_paths(src_dir, rel_paths, exclude_dirs=EXCLUDED_DIRS, missing=None):
+    """Yield (rel_dir, files) like walk_tree, but only for the given relative paths.
+
+    Directories are walked recursively, files are yielded on their own and paths
+    that no longer exist are appended to missing.
+    """
+    rel_paths = set(rel_paths)
+    for rel_path in sorted(rel_paths):
+        parts = rel_path.split(os.sep)
+        if any(part in exclude_dirs for part in parts):
+            continue
+        if any(os.sep.join(parts[:i]) in rel_paths for i in range(1, len(parts))):
+            continue  # an ancestor directory is already being walked
+        path = os.path.join(src_dir, rel_path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if missing is not None:
+                missing.append(rel_path)
+            continue
+        except OSError as e:
+            logging.error(f"Error reading {path}: {e}")
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            if not os.path.islink(path):
+                yield from walk_tree(src_dir, exclude_dirs, start=rel_path)
+        else:
+            yield os.path.dirname(rel_path), [(os.path.basename(rel_path), path, st)]
+
+class DestDirCache:
+    """Remembers destination directories already known to exist across backup cycles."""
+
+    def __init__(self):
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, path):
+        """Create path if needed; repeat calls for a known directory cost no syscalls."""
+        if path in self._known:
+            return
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._known.add(path)
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+
+_dest_dir_caches = {}
+
+def dest_dir_cache_for(dest_dir):
+    """Return the long-lived DestDirCache of a destination root."""
+    return _dest_dir_caches.setdefault(os.path.abspath(dest_dir), DestDirCache())
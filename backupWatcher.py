@@ -0,0 +1,203 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from backupWalker import EXCLUDED_DIRS
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+READ_SIZE = 64 * 1024
+DEBOUNCE_SECONDS = 1.0  # quiet period before a burst of events is handed over
+MAX_DEBOUNCE_SECONDS = 10.0  # never hold events back longer than this
+
+_libc = None
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return _libc
+
+def inotify_available():
+    """True when running on Linux with a libc that exposes inotify."""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return hasattr(_load_libc(), 'inotify_init1')
+    except OSError:
+        return False
+
+class InotifyWatcher:
+    """Watches several source trees with inotify and reports changed paths per root.
+
+    collect() returns {src_dir: set of relative paths}. A relative path may name a
+    file or a directory; a directory means its whole subtree must be re-scanned.
+    When the kernel queue overflows, needs_full_rescan is set and the caller must
+    fall back to a full walk.
+    """
+
+    def __init__(self, src_dirs, exclude_dirs=EXCLUDED_DIRS):
+        self.exclude_dirs = exclude_dirs
+        self.needs_full_rescan = False
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self._watches = {}  # wd -> (src_dir, rel_dir)
+        self._pending = {}
+        self.src_dirs = list(src_dirs)
+        for src_dir in self.src_dirs:
+            self._add_tree(src_dir, '')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watch(self, src_dir, rel_dir):
+        path = os.path.join(src_dir, rel_dir) if rel_dir else src_dir
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                logging.error(f"inotify watch limit reached at {path}; falling back to full rescans")
+                self.needs_full_rescan = True
+            elif err not in (errno.ENOENT, errno.ENOTDIR):
+                logging.error(f"Error watching {path}: {os.strerror(err)}")
+            return False
+        self._watches[wd] = (src_dir, rel_dir)
+        return True
+
+    def _add_tree(self, src_dir, rel_dir):
+        pending = [rel_dir]
+        while pending:
+            current = pending.pop()
+            if not self._add_watch(src_dir, current):
+                continue
+            path = os.path.join(src_dir, current) if current else src_dir
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.name not in self.exclude_dirs and entry.is_dir(follow_symlinks=False):
+                            pending.append(os.path.join(current, entry.name))
+            except OSError as e:
+                logging.error(f"Error scanning directory {path} for watches: {e}")
+
+    def _drop_tree(self, src_dir, rel_dir):
+        prefix = rel_dir + os.sep
+        for wd, (root, watched) in list(self._watches.items()):
+            if root == src_dir and (watched == rel_dir or watched.startswith(prefix)):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def add_source(self, src_dir):
+        """Start watching another source tree without touching the existing watches."""
+        if src_dir not in self.src_dirs:
+            self.src_dirs.append(src_dir)
+            self._add_tree(src_dir, '')
+
+    def remove_source(self, src_dir):
+        """Stop watching a source tree and drop its pending changes."""
+        if src_dir in self.src_dirs:
+            self.src_dirs.remove(src_dir)
+            for wd, (root, _watched) in list(self._watches.items()):
+                if root == src_dir:
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    del self._watches[wd]
+            self._pending.pop(src_dir, None)
+
+    def _queue(self, src_dir, rel_path):
+        self._pending.setdefault(src_dir, set()).add(rel_path)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return 0
+        offset = 0
+        count = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            count += 1
+            self._handle_event(wd, mask, name)
+        return count
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            logging.error("inotify event queue overflowed; scheduling a full rescan")
+            self.needs_full_rescan = True
+            return
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        watch = self._watches.get(wd)
+        if watch is None or not name or name in self.exclude_dirs:
+            return
+        src_dir, rel_dir = watch
+        rel_path = os.path.join(rel_dir, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(src_dir, rel_path)
+            elif mask & (IN_MOVED_FROM | IN_DELETE):
+                self._drop_tree(src_dir, rel_path)
+        self._queue(src_dir, rel_path)
+
+    def collect(self, timeout, debounce=DEBOUNCE_SECONDS, max_delay=MAX_DEBOUNCE_SECONDS):
+        """Block up to timeout seconds for changes, then coalesce the burst that follows.
+
+        Once the first event arrives, keep reading until no event has been seen for
+        debounce seconds (or max_delay has passed), so a file saved ten times in a
+        second is reported once.
+        """
+        if not self._pending and not self.needs_full_rescan:
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+            if not ready:
+                return {}
+        deadline = time.monotonic() + max_delay
+        while True:
+            self._read_events()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([self._fd], [], [], min(debounce, remaining))
+            if not ready:
+                break
+        changes, self._pending = self._pending, {}
+        return changes
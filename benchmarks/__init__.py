@@ -0,0 +1 @@
+"""Reproducible benchmarks for the backup engine; see benchmarks/README.md."""
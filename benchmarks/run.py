@@ -0,0 +1,235 @@
+"""Run the backup benchmarks and compare them against a saved baseline.
+
+    python -m benchmarks.run --scale 0.1 --output results.json
+    python -m benchmarks.run --baseline results.json --fail-on-regression
+
+Every (profile, scenario) runs in a fresh child process so peak RSS and
+syscall counts belong to that scenario alone.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from backupDurability import DURABILITY_BATCH, DURABILITY_LEVELS
+from benchmarks.treegen import DEFAULT_SEED, PROFILES, apply_churn, apply_renames, generate_tree, tree_bytes
+
+SCENARIOS = {
+    'cold': 'first backup into an empty destination',
+    'rescan': 'second backup with nothing changed',
+    'churn': 'backup after rewriting churn%% of the files',
+    'rename': 'backup after renaming rename%% of the files',
+    'checksum': 'calculate_checksum over every source file',
+    'changed': 'is_file_changed over every file against a current manifest',
+}
+DEFAULT_THRESHOLD = 0.10  # relative slowdown in wall time reported as a regression
+
+def _io_counters():
+    """(read + write syscalls, bytes read, bytes written) from /proc on Linux, else None.
+
+    /proc/self/io only counts the read and write families; stat, open and
+    directory listing calls are not included.
+    """
+    try:
+        with open('/proc/self/io') as f:
+            values = dict(line.split(': ') for line in f.read().splitlines())
+        return int(values['syscr']) + int(values['syscw']), int(values['rchar']), int(values['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+def _backup(src, dest, manifest_path, workers, options):
+    from backupFoldersFiles_main import backup_files
+    from backupManifest import BackupManifest
+    with BackupManifest(manifest_path) as manifest:
+        return backup_files(src, dest, manifest, workers, None, options)
+
+def run_child(profile, scenario, scale, seed, workers, churn, rename, work_dir, durability):
+    """Prepare and measure one scenario in this process; return its result dict."""
+    from backupFoldersFiles_main import calculate_checksum, is_file_changed
+    from backupLogging import setup_logging, shutdown_logging
+    from backupManifest import BackupManifest
+    from backupStats import BackupStats
+
+    root = tempfile.mkdtemp(prefix=f"bench-{profile}-{scenario}-", dir=work_dir)
+    try:
+        src = os.path.join(root, 'src')
+        dest = os.path.join(root, 'dest')
+        manifest_path = os.path.join(root, 'manifest.sqlite')
+        setup_logging(os.path.join(root, 'bench.log'))
+        options = {'workers': workers, 'durability': durability}
+        files = generate_tree(src, profile, scale, seed)
+        if scenario != 'checksum' and scenario != 'cold':
+            _backup(src, dest, manifest_path, workers, options)
+        if scenario == 'churn':
+            apply_churn(src, files, churn, seed)
+        elif scenario == 'rename':
+            files = apply_renames(src, files, rename, seed)
+        total_bytes = tree_bytes(src, files)
+
+        io_before = _io_counters()
+        cpu_before = _cpu_seconds()
+        started = time.perf_counter()
+        copied = 0
+        if scenario == 'checksum':
+            for rel_file in files:
+                calculate_checksum(os.path.join(src, rel_file))
+            processed = total_bytes
+        elif scenario == 'changed':
+            stats = BackupStats(src, dest)
+            with BackupManifest(manifest_path) as manifest:
+                for rel_file in files:
+                    is_file_changed(os.path.join(src, rel_file), os.path.join(dest, rel_file), manifest, rel_file,
+                                    stats=stats)
+            processed = stats.get('bytes_hashed')
+        else:
+            stats = _backup(src, dest, manifest_path, workers, options)
+            copied = stats.get('bytes_copied')
+            processed = stats.get('bytes_hashed')  # every copied byte is hashed as it is read
+        wall = time.perf_counter() - started
+        cpu = _cpu_seconds() - cpu_before
+        io_after = _io_counters()
+        shutdown_logging()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    result = {
+        'profile': profile,
+        'scenario': scenario,
+        'files': len(files),
+        'bytes': total_bytes,
+        'bytes_copied': copied,
+        'bytes_processed': processed,
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'files_per_second': len(files) / wall if wall else None,
+        'mb_per_second': processed / wall / 1e6 if wall else None,
+        'peak_rss_kb': _peak_rss_kb(),
+        'read_write_syscalls': None,
+        'read_bytes': None,
+        'write_bytes': None,
+    }
+    if io_before and io_after:
+        result['read_write_syscalls'], result['read_bytes'], result['write_bytes'] = (
+            after - before for after, before in zip(io_after, io_before))
+    return result
+
+def run_scenario(profile, scenario, args):
+    """Run one scenario args.repeat times, each in a child process; return the median run's result."""
+    command = [sys.executable, '-m', 'benchmarks.run', '--child', profile, scenario,
+               '--scale', str(args.scale), '--seed', str(args.seed), '--workers', str(args.workers),
+               '--churn', str(args.churn), '--rename', str(args.rename), '--durability', args.durability]
+    if args.work_dir:
+        command += ['--work-dir', args.work_dir]
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(max(1, args.repeat)):
+        completed = subprocess.run(command, cwd=repo_root, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{profile}/{scenario} failed:\n{completed.stderr}")
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    runs.sort(key=lambda run: run['wall_seconds'])
+    result = runs[len(runs) // 2]
+    result['wall_seconds_runs'] = [run['wall_seconds'] for run in runs]
+    return result
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return (report lines, regressions) comparing wall times with a baseline results file."""
+    previous = {f"{r['profile']}/{r['scenario']}": r for r in baseline.get('results', [])}
+    lines = []
+    regressions = []
+    for result in results:
+        key = f"{result['profile']}/{result['scenario']}"
+        old = previous.get(key)
+        if old is None or not old['wall_seconds']:
+            lines.append(f"{key:20} {result['wall_seconds']:9.3f}s   (no baseline)")
+            continue
+        change = result['wall_seconds'] / old['wall_seconds'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        lines.append(f"{key:20} {result['wall_seconds']:9.3f}s vs {old['wall_seconds']:9.3f}s  {change:+7.1%}{flag}")
+    return lines, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark backup_files, calculate_checksum and is_file_changed.")
+    parser.add_argument('--profiles', default=','.join(PROFILES), help="comma-separated tree profiles")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma-separated scenarios")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies file counts (and huge file sizes)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--durability', default=DURABILITY_BATCH, choices=DURABILITY_LEVELS,
+                        help="durability level of the destination writes")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per scenario; the median is reported")
+    parser.add_argument('--churn', type=float, default=1.0, help="percent of files rewritten by the churn scenario")
+    parser.add_argument('--rename', type=float, default=10.0, help="percent of files renamed by the rename scenario")
+    parser.add_argument('--work-dir', help="where trees are generated (default: system temp dir)")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--baseline', help="results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--child', nargs=2, metavar=('PROFILE', 'SCENARIO'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_child(*args.child, args.scale, args.seed, args.workers, args.churn, args.rename, args.work_dir,
+                           args.durability)
+        print(json.dumps(result))
+        return 0
+
+    results = []
+    for profile in args.profiles.split(','):
+        for scenario in args.scenarios.split(','):
+            result = run_scenario(profile, scenario, args)
+            results.append(result)
+            print(f"{profile}/{scenario:9} {result['wall_seconds']:9.3f}s {result['files_per_second'] or 0:11.0f} "
+                  f"files/s {result['mb_per_second'] or 0:9.1f} MB/s  read/write syscalls "
+                  f"{result['read_write_syscalls']}  peak RSS {result['peak_rss_kb']} KB", flush=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scale': args.scale,
+            'seed': args.seed,
+            'workers': args.workers,
+            'repeat': args.repeat,
+            'durability': args.durability,
+            'churn_percent': args.churn,
+            'rename_percent': args.rename,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressions = compare(results, json.load(f), args.threshold)
+        print('\n'.join(lines))
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
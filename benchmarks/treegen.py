@@ -0,0 +1,95 @@
+import os
+import random
+
+# name -> (file count, min size, max size, directory fan-out, nesting depth) at scale 1.0
+PROFILES = {
+    'tiny': (20000, 0, 4 * 1024, 50, 2),  # many tiny files
+    'huge': (3, 64 * 1024 * 1024, 64 * 1024 * 1024, 1, 1),  # a few huge files
+    'deep': (2000, 1024, 16 * 1024, 2, 40),  # deep nesting
+    'mixed': (5000, 0, 2 * 1024 * 1024, 20, 4),  # mostly small files with some large ones
+}
+DEFAULT_SEED = 20240101
+DEEP_FILES_PER_DIR = 16  # files sharing a leaf directory of the deep profile
+WRITE_CHUNK = 1024 * 1024
+
+def _file_size(rng, min_size, max_size, profile):
+    if profile == 'mixed':
+        # Log-uniform: many small files and a tail of large ones, like a home directory
+        return int(min(max_size, max(min_size, 2 ** rng.uniform(6, 21))))
+    return rng.randint(min_size, max_size)
+
+def _rel_dir(index, fanout, depth):
+    """Directory of the index-th file: depth levels, fanout directories per level."""
+    parts = []
+    value = index
+    for level in range(depth - 1):
+        parts.append(f"dir{level}_{value % fanout}" if fanout > 1 else f"level{level}")
+        value //= max(fanout, 1)
+    return os.path.join(*parts) if parts else ''
+
+def _deep_rel_dir(index, fanout, depth):
+    """Directory of the index-th file of the deep profile: a shared trunk that branches near the leaves."""
+    parts = []
+    value = index // DEEP_FILES_PER_DIR
+    for level in reversed(range(depth - 1)):
+        parts.append(f"level{level}_{value % fanout}")
+        value //= fanout
+    return os.path.join(*reversed(parts))
+
+def _write_random(path, rng, size):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            chunk = min(remaining, WRITE_CHUNK)
+            f.write(rng.randbytes(chunk))
+            remaining -= chunk
+
+def generate_tree(root, profile, scale=1.0, seed=DEFAULT_SEED):
+    """Create the profile's tree under root; the same (profile, scale, seed) always gives the same bytes.
+
+    Returns the list of relative file paths. File mtimes are fixed too, so two
+    generated trees stat the same apart from inode numbers.
+    """
+    count, min_size, max_size, fanout, depth = PROFILES[profile]
+    count = max(1, int(count * scale))
+    if profile == 'huge':
+        min_size = max_size = max(1, int(max_size * scale))
+    rng = random.Random(f"{seed}-{profile}")
+    files = []
+    for index in range(count):
+        if profile == 'deep':
+            rel_dir = _deep_rel_dir(index, fanout, depth)
+        else:
+            rel_dir = _rel_dir(index, fanout, depth)
+        rel_file = os.path.join(rel_dir, f"file{index:06d}.bin")
+        path = os.path.join(root, rel_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_random(path, rng, _file_size(rng, min_size, max_size, profile))
+        os.utime(path, ns=(1_600_000_000 * 10**9 + index, 1_600_000_000 * 10**9 + index))
+        files.append(rel_file)
+    return files
+
+def apply_churn(root, files, percent, seed=DEFAULT_SEED):
+    """Rewrite percent of the files in place (same size, new content); return the changed paths."""
+    rng = random.Random(f"{seed}-churn")
+    changed = rng.sample(files, max(1, int(len(files) * percent / 100))) if files else []
+    for rel_file in changed:
+        path = os.path.join(root, rel_file)
+        _write_random(path, rng, os.path.getsize(path))
+    return changed
+
+def apply_renames(root, files, percent, seed=DEFAULT_SEED):
+    """Rename percent of the files (content unchanged); return the new list of relative paths."""
+    rng = random.Random(f"{seed}-rename")
+    renamed = set(rng.sample(files, max(1, int(len(files) * percent / 100)))) if files else set()
+    result = []
+    for rel_file in files:
+        if rel_file in renamed:
+            new_rel = rel_file[:-len('.bin')] + '.renamed.bin'
+            os.rename(os.path.join(root, rel_file), os.path.join(root, new_rel))
+            rel_file = new_rel
+        result.append(rel_file)
+    return result
+
+def tree_bytes(root, files):
+    return sum(os.path.getsize(os.path.join(root, rel_file)) for rel_file in files)
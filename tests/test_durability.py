@@ -0,0 +1,53 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from backupDurability import DURABILITY_BATCH, DURABILITY_LEVELS, Publisher
+from backupResume import copy_via_temp
+
+
+class ReadOnlySourceTest(unittest.TestCase):
+    """A 0444 source gives its temp copy a read-only mode before the copy is synced and published."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.src_file = os.path.join(self._dir.name, 'ro.txt')
+        with open(self.src_file, 'wb') as f:
+            f.write(b'read-only content\n')
+        os.chmod(self.src_file, 0o444)
+        self.dest_dir = os.path.join(self._dir.name, 'dst')
+        os.mkdir(self.dest_dir)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _backup(self, publisher):
+        dest_file = os.path.join(self.dest_dir, 'ro.txt')
+        published = []
+
+        def publish(temp_file, checksum):
+            publisher.publish(temp_file, dest_file, os.stat(temp_file).st_size, lambda: published.append(checksum))
+
+        copy_via_temp(self.src_file, dest_file, publish=publish)
+        publisher.flush()
+        self.assertEqual(len(published), 1)
+        with open(dest_file, 'rb') as f:
+            self.assertEqual(f.read(), b'read-only content\n')
+        self.assertEqual(stat.S_IMODE(os.stat(dest_file).st_mode), 0o444)
+        self.assertEqual(os.listdir(self.dest_dir), ['ro.txt'])
+
+    def test_every_level(self):
+        for level in DURABILITY_LEVELS:
+            with self.subTest(level=level):
+                self._backup(Publisher(level))
+                os.remove(os.path.join(self.dest_dir, 'ro.txt'))
+
+    def test_batch_without_syncfs(self):
+        publisher = Publisher(DURABILITY_BATCH)
+        publisher.use_syncfs = False  # per-file fallback, as on Windows
+        self._backup(publisher)
+
+
+if __name__ == '__main__':
+    unittest.main()